@@ -1,4 +1,4 @@
-from server.utils.response import make_response
+from server.utils.response import make_response, FastResponse
 from server.controllers.video_controller import router as video_router
 from server.controllers.entity_controller import router as entity_router
 from server.controllers.admin_controller import router as admin_router
@@ -6,8 +6,15 @@ from server.controllers.media_controller import router as media_router
 from server.controllers.chapter_controller import router as chapter_router
 from server.controllers.project_controller import router as project_router
 from server.config.config import load_config
+from server.services.kg_service import KGService
+from server.services.schemas import warm_schemas
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, HTTPException
+from server.utils.compression import JSONGZipMiddleware
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+import asyncio
+import contextlib
+import importlib.util
 import signal
 import sys
 import os
@@ -19,7 +26,20 @@ sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..')))
 
 
-app = FastAPI()
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Load configuration once; routes read the snapshot from app.state.config
+    Build the LLM output schemas before the first request needs them
+    On shutdown, write knowledge graph saves still waiting for their debounce delay
+    """
+    app.state.config = load_config()
+    await asyncio.to_thread(warm_schemas)
+    yield
+    KGService().flush_pending_saves()
+
+
+app = FastAPI(default_response_class=FastResponse, lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -30,6 +50,22 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Compress JSON payloads (entity lists, workflows, KG); media files and the chapter SSE stream pass through
+app.add_middleware(
+    JSONGZipMiddleware,
+    minimum_size=1024,
+    exclude_paths=('/media/get_image', '/media/get_audio',
+                   '/video/get_video', '/chapter/generate'),
+)
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """Report request model validation errors with the unified response format"""
+    fields = ', '.join(
+        '.'.join(str(loc) for loc in err['loc'] if loc != 'body') for err in exc.errors())
+    return make_response(status='error', msg=f'Missing or invalid parameters: {fields}')
+
 
 # Register routers
 app.include_router(project_router)
@@ -48,6 +84,11 @@ if __name__ == '__main__':
     import uvicorn
     config = load_config()
     signal.signal(signal.SIGINT, signal_handler)
+    # uvloop is not available on Windows; fall back to the asyncio loop there
+    loop = 'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio'
+    http = 'httptools' if importlib.util.find_spec('httptools') else 'h11'
     uvicorn.run("server.app:app", host=config.get('server', {}).get('host', '0.0.0.0'),
                 port=config.get('server', {}).get('port', 5001),
+                loop=loop,
+                http=http,
                 reload=True)
@@ -1,75 +1,147 @@
+import copy
 import json
 import os
+import orjson
 import yaml
 from typing import Dict, Any
+from server.utils.file_io import read_bytes
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:  # PyYAML built without LibYAML
+    from yaml import SafeLoader, SafeDumper
+
+# Absolute paths computed once at import
+_CONFIG_DIR = os.path.dirname(os.path.abspath(__file__))
+_SERVER_DIR = os.path.dirname(_CONFIG_DIR)
+_CONFIG_PATH = os.path.join(_CONFIG_DIR, 'config.yaml')
+_PROMPT_STYLER_PATH = os.path.join(_CONFIG_DIR, 'prompt_styler.json')
+
+config = {}  # Latest configuration snapshot, replaced on every reload
+# mtime of config.yaml the global dictionary was last built from
+_cache = {"mtime": None, "data": None}
+# prompt_styler.json contents plus a name -> style index
+_styles_cache = {"mtime": None, "list": None, "by_name": None}
+# *.json files in the workflow directory, keyed on the directory mtime
+_workflow_scan = {"path": None, "mtime": None, "files": []}
+
+
+def _server_path(relative_path: str) -> str:
+    """Absolute path under the server directory (string ops only, no getcwd)"""
+    return os.path.normpath(os.path.join(_SERVER_DIR, relative_path))
+
+
+def _scan_workflows(workflow_path: str) -> list:
+    """List workflow files, rescanning only when the directory changed"""
+    try:
+        mtime = os.stat(workflow_path).st_mtime_ns
+    except (OSError, ValueError):
+        return []
+    if _workflow_scan["path"] != workflow_path or _workflow_scan["mtime"] != mtime:
+        try:
+            with os.scandir(workflow_path) as it:
+                files = [e.name for e in it if e.name.endswith('.json')]
+        except NotADirectoryError:
+            files = []
+        _workflow_scan.update(path=workflow_path, mtime=mtime, files=files)
+    return list(_workflow_scan["files"])
+
+
+def _read_config_file(config_path: str, mtime: int) -> Dict[str, Any]:
+    """Parse config.yaml, going through the JSON sidecar cache when it is fresh"""
+    json_cache_path = config_path + '.json'
+    try:
+        if os.stat(json_cache_path).st_mtime_ns >= mtime:
+            with open(json_cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
 
-config = {}  # Global dictionary shared across modules
+    with open(config_path, 'r', encoding='utf-8') as f:
+        new_config = yaml.load(f, Loader=SafeLoader) or {}
+
+    try:
+        with open(json_cache_path, 'w', encoding='utf-8') as f:
+            json.dump(new_config, f, ensure_ascii=False)
+    except (OSError, TypeError, ValueError):
+        # The cache is only an optimisation; drop a partial write
+        if os.path.exists(json_cache_path):
+            os.remove(json_cache_path)
+    return new_config
 
 
 def load_config() -> Dict[str, Any]:
-    global config
-    """Load configuration from config.yaml and update global dictionary"""
-    config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
-    with open(config_path, 'r', encoding='utf-8') as f:
-        new_config = yaml.safe_load(f) or {}
+    """Load configuration from config.yaml and return it as a new snapshot.
 
-    # Clear and update global dictionary
-    config.clear()
-    config.update(new_config)
+    The global dictionary is replaced rather than mutated, so a reader holding
+    an older snapshot never observes a half-updated configuration.
+    """
+    global config
+    mtime = os.stat(_CONFIG_PATH).st_mtime_ns
+    if _cache["mtime"] == mtime and _cache["data"] is not None:
+        return _cache["data"]
 
-    # Handle computed properties
-    server_dir = os.path.dirname(os.path.dirname(__file__))
+    new_config = _read_config_file(_CONFIG_PATH, mtime)
 
     # Convert paths
-    if 'relative_projects_path' in config and 'projects_path' not in config:
-        config['projects_path'] = os.path.abspath(
-            os.path.join(server_dir, config['relative_projects_path']))
+    if 'relative_projects_path' in new_config and 'projects_path' not in new_config:
+        new_config['projects_path'] = _server_path(
+            new_config['relative_projects_path'])
 
-    if 'relative_prompts_path' in config and 'prompts_path' not in config:
-        config['prompts_path'] = os.path.abspath(
-            os.path.join(server_dir, config['relative_prompts_path']))
+    if 'relative_prompts_path' in new_config and 'prompts_path' not in new_config:
+        new_config['prompts_path'] = _server_path(
+            new_config['relative_prompts_path'])
 
-    if 'default_workflow' in config and 'file' in config['default_workflow']:
-        config['default_workflow']['file'] = os.path.abspath(
-            os.path.join(server_dir, config['default_workflow']['file']))
+    if 'default_workflow' in new_config and 'file' in new_config['default_workflow']:
+        new_config['default_workflow']['file'] = _server_path(
+            new_config['default_workflow']['file'])
 
-    if 'relative_workflow_path' in config and 'workflow_path' not in config:
-        config['workflow_path'] = os.path.abspath(
-            os.path.join(server_dir, config['relative_workflow_path']))
+    if 'relative_workflow_path' in new_config and 'workflow_path' not in new_config:
+        new_config['workflow_path'] = _server_path(
+            new_config['relative_workflow_path'])
 
     # Scan workflow files
-    workflow_path = config.get('workflow_path', '')
-    config['all_workflow'] = []
-    if os.path.exists(workflow_path) and os.path.isdir(workflow_path):
-        config['all_workflow'] = [f for f in os.listdir(
-            workflow_path) if f.endswith('.json')]
+    new_config['all_workflow'] = _scan_workflows(
+        new_config.get('workflow_path', ''))
 
-    return config
+    # Publish the snapshot with a single reference swap
+    config = new_config
+    _cache["mtime"] = mtime
+    _cache["data"] = new_config
+    return new_config
 
 
-def save_config(_config: Dict[str, Any]) -> None:
-    global config
-    """Save configuration and update global dictionary (excluding computed properties)"""
-    config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
-    with open(config_path, 'w', encoding='utf-8') as f:
-        yaml.dump(_config, f, allow_unicode=True, sort_keys=False)
-
-    # Update only base configuration, preserving computed properties in memory
-    config.clear()
-    config.update(_config)
+def current_config() -> Dict[str, Any]:
+    """Latest loaded configuration snapshot, without checking config.yaml on disk"""
+    data = _cache["data"]
+    return data if data is not None else load_config()
+
+
+async def get_projects_path() -> str:
+    """Resolved projects directory (FastAPI dependency; async so it runs on the event loop)"""
+    return current_config().get('projects_path', 'projects/')
+
+
+def save_config(_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Save configuration (excluding computed properties) and return the reloaded snapshot"""
+    with open(_CONFIG_PATH, 'w', encoding='utf-8') as f:
+        yaml.dump(_config, f, Dumper=SafeDumper,
+                  allow_unicode=True, sort_keys=False)
+    _cache["mtime"] = None
+
     # Reload config to regenerate computed properties
-    load_config()
+    return load_config()
 
 
 def update_config(updates: Dict[str, Any]) -> Dict[str, Any]:
-    global config
-    """Update configuration while keeping global dictionary reference intact"""
+    """Update configuration and return the new snapshot"""
 
-    # Create a copy of base configuration (filter out computed properties)
-    filtered_config = {
-        k: v for k, v in config.items()
+    # Copy the base configuration (filter out computed properties); deep copy so
+    # the nested updates below never touch the snapshot other readers hold
+    filtered_config = copy.deepcopy({
+        k: v for k, v in current_config().items()
         if k not in ['projects_path', 'prompts_path', 'workflow_path', 'all_workflow']
-    }
+    })
 
     # Handle nested updates
     for key, value in updates.items():
@@ -80,29 +152,32 @@ def update_config(updates: Dict[str, Any]) -> Dict[str, Any]:
         current[keys[-1]] = value
 
     # Save and reload configuration
-    save_config(filtered_config)
-    return config
+    return save_config(filtered_config)
+
+
+def _load_styles_cache() -> Dict[str, Any]:
+    """Reload prompt_styler.json into _styles_cache when its mtime changes"""
+    mtime = os.stat(_PROMPT_STYLER_PATH).st_mtime_ns
+    if _styles_cache["mtime"] != mtime:
+        styles = orjson.loads(read_bytes(_PROMPT_STYLER_PATH))
+        by_name = {}
+        for style in styles:
+            # Keep the first style for duplicated names, like a linear scan would
+            by_name.setdefault(style.get('name'), style)
+        _styles_cache.update(mtime=mtime, list=styles, by_name=by_name)
+    return _styles_cache
 
 
 def load_prompt_styler():
-    prompt_styler_path = os.path.join(
-        os.path.dirname(__file__), 'prompt_styler.json')
-    with open(prompt_styler_path, 'r', encoding='utf-8') as f:
-        styles = json.load(f)
-    return styles
+    return _load_styles_cache()["list"]
 
 
 def save_prompt_styler(styles):
-    prompt_styler_path = os.path.join(
-        os.path.dirname(__file__), 'prompt_styler.json')
-    with open(prompt_styler_path, 'w', encoding='utf-8') as f:
-        json.dump(styles, f, ensure_ascii=False, indent=4)
+    with open(_PROMPT_STYLER_PATH, 'wb') as f:
+        f.write(orjson.dumps(styles, option=orjson.OPT_INDENT_2))
+    _styles_cache["mtime"] = None
 
 
 def get_prompt_style_by_name(style_name: str) -> Dict[str, Any] | None:
     """Find prompt style by name"""
-    styles = load_prompt_styler()
-    for style in styles:
-        if style.get('name') == style_name:
-            return style
-    return None
+    return _load_styles_cache()["by_name"].get(style_name)
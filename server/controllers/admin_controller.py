@@ -1,18 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from server.config.config import load_config, update_config, load_prompt_styler, save_prompt_styler
+from server.config.config import update_config, load_prompt_styler, save_prompt_styler
 import os
 import json
 from server.utils.response import make_response
 
 router = APIRouter(prefix='/admin')
-config = load_config()
 
 
 @router.get('/config')
-async def get_config():
+async def get_config(request: Request):
     """Retrieve current configuration"""
     try:
-        config = load_config()
+        config = request.app.state.config
         return make_response(
             data=config,
             msg='Configuration retrieved successfully'
@@ -33,7 +32,7 @@ async def update_configuration(request: Request):
         return make_response(status='error', msg='Configuration data cannot be empty')
 
     try:
-        update_config(data)
+        request.app.state.config = update_config(data)
         return make_response(
             data=data,
             msg='Configuration updated successfully'
@@ -1,44 +1,116 @@
 import asyncio
+import hashlib
+import aiofiles
 from fastapi import APIRouter, Depends, HTTPException, Request
 import os
-from server.config.config import load_config
-import json
+from server.config.config import get_projects_path
+import orjson
 from datetime import datetime
-from server.utils.response import make_response
+from server.utils.response import make_response, PROJECT_MISSING
+from server.utils.file_io import read_bytes, read_text
 from server.services.llm_service import LLMService
 from server.services.chapter_file_service import ChapterFileService
+from server.services.kg_service import KGService
 import logging
 from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List
 
 router = APIRouter(prefix='/chapter')
+logger = logging.getLogger(__name__)
+# Number of streamed tokens between client disconnect checks
+DISCONNECT_CHECK_INTERVAL = 8
 llm_service = LLMService()
 chapter_file_server = ChapterFileService()
+kg_service = KGService()
+
+class CreateChapterReq(BaseModel):
+    project_name: str = Field(..., min_length=1)
+
+
+class ChapterReq(BaseModel):
+    project_name: str = Field(..., min_length=1)
+    chapter_name: str = Field(..., min_length=1)
+
+
+class GenerateChapterReq(ChapterReq):
+    prompt: str = Field(..., min_length=1)
+    is_continuation: bool = False
+    use_last_chapter: bool = True
+
+
+class SaveChapterReq(ChapterReq):
+    content: str = Field(..., min_length=1)
+
+
+class SaveScenesReq(ChapterReq):
+    scenes: List[Dict[str, Any]] = Field(..., min_length=1)
+
+
+class TranslatePromptReq(BaseModel):
+    project_name: str = Field(..., min_length=1)
+    prompts: List[str] = Field(..., min_length=1)
+
+
+# extract_characters results keyed on (project, content hash, kg.json mtime)
+CHARACTER_CACHE_SIZE = 256
+CHARACTER_CACHE_FILE = 'characters_cache.json'
+_character_cache = {}
+# Sorted chapter names keyed on project path: (project dir mtime, chapters)
+_chapter_list_cache: Dict[str, tuple] = {}
+
+
+def _kg_version(project_path: str) -> int:
+    """mtime of the project's kg.json; extraction output depends on the KG state"""
+    try:
+        return os.stat(os.path.join(project_path, 'kg.json')).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _load_cached_characters(cache_file: str, key: str):
+    """Return the persisted extraction result for key, or None"""
+    try:
+        cached = orjson.loads(read_bytes(cache_file))
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    return cached.get('data') if cached.get('key') == key else None
+
+
+def _store_cached_characters(project_name: str, digest: str, project_path: str, cache_file: str, characters) -> None:
+    """Remember an extraction result in memory and next to the chapter"""
+    key = (project_name, digest, _kg_version(project_path))
+    _character_cache.pop(key, None)
+    _character_cache[key] = characters
+    while len(_character_cache) > CHARACTER_CACHE_SIZE:
+        _character_cache.pop(next(iter(_character_cache)))
+    try:
+        with open(cache_file, 'wb') as f:
+            f.write(orjson.dumps({'key': f'{digest}:{key[2]}', 'data': characters}))
+    except (OSError, TypeError) as e:
+        logging.warning(f'Failed to persist character extraction cache: {e}')
 
 
 @router.post('/create')
-async def create_chapter(request: Request):
+async def create_chapter(body: CreateChapterReq, projects_path: str = Depends(get_projects_path)):
     """Create a new chapter"""
-    data = await request.json()
-    project_name = data.get('project_name')
-
-    if not project_name:
-        return make_response(status='error', msg='Missing required parameters')
+    project_name = body.project_name
 
     try:
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
         project_path = os.path.join(projects_path, project_name)
 
         # Get the latest chapter number
-        latest_num = chapter_file_server.get_latest_chapter(project_path)
+        latest_num = await asyncio.to_thread(
+            chapter_file_server.get_latest_chapter, project_path)
         new_chapter = f'chapter{latest_num + 1}'
         new_chapter_path = os.path.join(project_path, new_chapter)
 
         # Create new chapter directory and content.txt file
-        os.makedirs(new_chapter_path, exist_ok=True)
+        await asyncio.to_thread(os.makedirs, new_chapter_path, exist_ok=True)
+        _chapter_list_cache.pop(project_path, None)
         content_file = os.path.join(new_chapter_path, 'content.txt')
-        with open(content_file, 'w', encoding='utf-8') as f:
-            f.write('')
+        async with aiofiles.open(content_file, 'w', encoding='utf-8') as f:
+            await f.write('')
 
         return make_response(data={'chapter': new_chapter}, msg='Chapter created successfully')
 
@@ -47,29 +119,24 @@ async def create_chapter(request: Request):
 
 
 @router.post('/generate')
-async def generate_chapter(request: Request):
+async def generate_chapter(body: GenerateChapterReq, request: Request, projects_path: str = Depends(get_projects_path)):
     """Generate chapter content"""
-    data = await request.json()
-    project_name = data.get('project_name')
-    chapter_name = data.get('chapter_name')
-    prompt = data.get('prompt')
-    is_continuation = data.get('is_continuation', False)
-    use_last_chapter = data.get('use_last_chapter', True)
-
-    if not all([project_name, chapter_name, prompt]):
-        return make_response(status='error', msg='Missing required parameters')
+    project_name = body.project_name
+    chapter_name = body.chapter_name
+    prompt = body.prompt
+    is_continuation = body.is_continuation
+    use_last_chapter = body.use_last_chapter
 
     try:
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
         chapter_path = os.path.join(projects_path, project_name, chapter_name)
 
-        if not os.path.exists(chapter_path):
+        if not await asyncio.to_thread(os.path.exists, chapter_path):
             return make_response(status='error', msg='Chapter path does not exist')
 
         # Get previous chapter content as context
         if use_last_chapter:
-            last_content = chapter_file_server.get_chapter_content(
+            last_content = await asyncio.to_thread(
+                chapter_file_server.get_chapter_content,
                 project_name, f'chapter{int(chapter_name[7:]) - 1}')
         else:
             last_content = ''
@@ -84,13 +151,16 @@ async def generate_chapter(request: Request):
                     generator = llm_service.generate_text(
                         prompt, project_name, last_content)
 
+                token_count = 0
                 async for generated_text in generator:
-                    if await request.is_disconnected():
+                    # is_disconnected() is an ASGI receive, poll it every few tokens
+                    if token_count % DISCONNECT_CHECK_INTERVAL == 0 and await request.is_disconnected():
                         break
-                    yield f"data: {generated_text}\n\n"
+                    token_count += 1
+                    yield b"data: " + generated_text.encode('utf-8') + b"\n\n"
             except asyncio.CancelledError:
                 # Handle client disconnection
-                print("Client connection interrupted")
+                logger.info("Client connection interrupted")
             finally:
                 # Perform necessary cleanup
                 if 'generator' in locals():
@@ -112,28 +182,21 @@ async def generate_chapter(request: Request):
 
 
 @router.post('/save')
-async def save_chapter_content(request: Request):
+async def save_chapter_content(body: SaveChapterReq, projects_path: str = Depends(get_projects_path)):
     """Save chapter content"""
-    data = await request.json()
-    project_name = data.get('project_name')
-    chapter_name = data.get('chapter_name')
-    content = data.get('content')
-
-    if not all([project_name, chapter_name, content]):
-        return make_response(status='error', msg='Missing required parameters')
+    project_name = body.project_name
+    chapter_name = body.chapter_name
+    content = body.content
 
     try:
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
         chapter_path = os.path.join(projects_path, project_name, chapter_name)
 
-        if not os.path.exists(chapter_path):
-            os.makedirs(chapter_path)
+        await asyncio.to_thread(os.makedirs, chapter_path, exist_ok=True)
 
         # Save content
         content_file = os.path.join(chapter_path, 'content.txt')
-        with open(content_file, 'w', encoding='utf-8') as f:
-            f.write(content)
+        async with aiofiles.open(content_file, 'w', encoding='utf-8') as f:
+            await f.write(content)
 
         return make_response(msg='Save successful')
 
@@ -142,19 +205,15 @@ async def save_chapter_content(request: Request):
 
 
 @router.post('/split_text')
-async def split_text(request: Request):
+async def split_text(body: ChapterReq):
     """Split chapter text into spans and generate prompts"""
-    data = await request.json()
-    project_name = data.get('project_name')
-    chapter_name = data.get('chapter_name')
-
-    if not project_name or not chapter_name:
-        return make_response(status='error', msg='Missing project_name or chapter_name')
+    project_name = body.project_name
+    chapter_name = body.chapter_name
 
     try:
         # Get chapter content using llm_service
-        content = chapter_file_server.get_chapter_content(
-            project_name, chapter_name)
+        content = await asyncio.to_thread(
+            chapter_file_server.get_chapter_content, project_name, chapter_name)
         if not content:
             return make_response(status='error', msg=f'Content not found for chapter {chapter_name}')
 
@@ -165,13 +224,15 @@ async def split_text(request: Request):
         if not spans_and_prompts:
             return make_response(status='error', msg='Text splitting failed, please try again.')
 
-        if all('error' in span for span in spans_and_prompts):
-            return make_response(status='error', msg='Text splitting failed', detail=spans_and_prompts)
+        # Stops at the first span without an error, i.e. the first one for normal output
+        if not any('error' not in span for span in spans_and_prompts):
+            return make_response(status='error', msg='Text splitting failed', data=spans_and_prompts)
 
-        print("Split count:", len(spans_and_prompts))
-        print("spans_and_prompts:", spans_and_prompts)
+        logger.debug("Split count: %d", len(spans_and_prompts))
+        logger.debug("spans_and_prompts: %s", spans_and_prompts)
         # Generate corresponding files
-        chapter_file_server.generate_span_files(
+        await asyncio.to_thread(
+            chapter_file_server.generate_span_files,
             project_name, chapter_name, spans_and_prompts)
 
         return make_response(status='success', msg='Split successful', data=spans_and_prompts)
@@ -181,27 +242,35 @@ async def split_text(request: Request):
 
 
 @router.get('/list')
-async def get_chapter_list(project_name: str):
+async def get_chapter_list(project_name: str, projects_path: str = Depends(get_projects_path)):
     """Get list of all chapters for a project"""
     if not project_name:
         return make_response(status='error', msg='Project name cannot be empty')
 
-    config = load_config()
-    projects_path = config.get('projects_path', 'projects/')
     project_path = os.path.join(projects_path, project_name)
 
-    if not os.path.exists(project_path):
-        return make_response(status='error', msg='Project does not exist')
+    try:
+        mtime = (await asyncio.to_thread(os.stat, project_path)).st_mtime_ns
+    except FileNotFoundError:
+        return PROJECT_MISSING()
 
     try:
+        # Adding or removing a chapter directory bumps the project directory mtime
+        cached = _chapter_list_cache.get(project_path)
+        if cached and cached[0] == mtime:
+            return make_response(data=cached[1])
+
         # Get all chapter directories and sort them
-        chapters = []
-        for item in sorted(os.listdir(project_path)):
-            item_path = os.path.join(project_path, item)
-            if os.path.isdir(item_path) and item.startswith('chapter'):
-                chapters.append(item)
+        def list_chapters():
+            # DirEntry.is_dir() reuses the type from the directory read, no extra stat
+            with os.scandir(project_path) as it:
+                return [entry.name for entry in it
+                        if entry.name.startswith('chapter') and entry.is_dir()]
+
+        chapters = await asyncio.to_thread(list_chapters)
         # Sort chapters by number instead of string
-        chapters.sort(key=lambda x: int(x.replace('chapter', '')))
+        chapters.sort(key=lambda x: int(x[7:]))  # strip 'chapter' prefix
+        _chapter_list_cache[project_path] = (mtime, chapters)
         return make_response(data=chapters)
     except Exception as e:
         return make_response(status='error', msg=str(e))
@@ -211,8 +280,8 @@ async def get_chapter_list(project_name: str):
 async def get_chapter_content(project_name: str, chapter_name: str):
     """Get content.txt content for specified chapter"""
     try:
-        content = chapter_file_server.get_chapter_content(
-            project_name, chapter_name)
+        content = await asyncio.to_thread(
+            chapter_file_server.get_chapter_content, project_name, chapter_name)
         return make_response(data={'content': content}, msg='Retrieved successfully')
 
     except Exception as e:
@@ -220,30 +289,41 @@ async def get_chapter_content(project_name: str, chapter_name: str):
 
 
 @router.post('/extract_characters')
-async def extract_characters(request: Request):
+async def extract_characters(body: ChapterReq, projects_path: str = Depends(get_projects_path)):
     """Extract character information from chapter"""
-    data = await request.json()
-    project_name = data.get('project_name')
-    chapter_name = data.get('chapter_name')
-
-    if not all([project_name, chapter_name]):
-        return make_response(status='error', msg='Missing required parameters')
+    project_name = body.project_name
+    chapter_name = body.chapter_name
 
     try:
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
         chapter_path = os.path.join(projects_path, project_name, chapter_name)
         content_file = os.path.join(chapter_path, 'content.txt')
 
-        if not os.path.exists(content_file):
+        if not await asyncio.to_thread(os.path.exists, content_file):
             return make_response(status='error', msg='Chapter content file does not exist')
 
         # Read chapter content
-        with open(content_file, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = await asyncio.to_thread(read_text, content_file)
+
+        # Same content against an unchanged KG yields the same extraction
+        project_path = os.path.join(projects_path, project_name)
+        cache_file = os.path.join(chapter_path, CHARACTER_CACHE_FILE)
+        digest = hashlib.blake2b(content.encode(
+            'utf-8'), digest_size=16).hexdigest()
+        # kg.json must reflect debounced entity edits before its mtime is used as the version
+        await asyncio.to_thread(kg_service.flush_pending_saves, project_name)
+        kg_version = await asyncio.to_thread(_kg_version, project_path)
+        characters = _character_cache.get((project_name, digest, kg_version))
+        if characters is None:
+            characters = await asyncio.to_thread(
+                _load_cached_characters, cache_file, f'{digest}:{kg_version}')
+        if characters is not None:
+            return make_response(data=characters, msg='Extraction successful')
 
         # Call LLM service to extract characters
         characters = await llm_service.extract_character(content, project_name)
+        # Key on the KG as saved by the extraction itself
+        await asyncio.to_thread(_store_cached_characters, project_name,
+                                digest, project_path, cache_file, characters)
         return make_response(data=characters, msg='Extraction successful')
 
     except Exception as e:
@@ -251,48 +331,42 @@ async def extract_characters(request: Request):
 
 
 @router.get('/scene_list')
-async def get_chapter_scene_list(project_name: str, chapter_name: str):
+async def get_chapter_scene_list(project_name: str, chapter_name: str, projects_path: str = Depends(get_projects_path)):
     """Get scene list for chapter"""
     if not project_name or not chapter_name:
         return make_response(status='error', msg='Missing project_name or chapter_name')
 
     try:
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
         chapter_dir = os.path.join(projects_path, project_name, chapter_name)
-        if not os.path.exists(chapter_dir):
+        if not await asyncio.to_thread(os.path.exists, chapter_dir):
             return make_response(status='error', msg=f'Chapter directory not found: {chapter_dir}')
 
-        scene_list = []
-        # Iterate through all numerically named subfolders
-        for item in sorted(os.listdir(chapter_dir), key=lambda x: int(x) if x.isdigit() else float('inf')):
-            if not item.isdigit():
-                continue
-
+        def load_span(item: str):
             span_dir = os.path.join(chapter_dir, item)
-            if not os.path.isdir(span_dir):
-                continue
-
-            # Read span.txt
-            span_file = os.path.join(span_dir, 'span.txt')
-            prompt_file = os.path.join(span_dir, 'prompt.json')
-
-            if not os.path.exists(span_file) or not os.path.exists(prompt_file):
-                continue
-
-            with open(span_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            with open(prompt_file, 'r', encoding='utf-8') as f:
-                prompt_data = json.load(f)
-
-            scene_list.append({
+            try:
+                content = read_text(os.path.join(span_dir, 'span.txt'))
+                prompt_data = orjson.loads(read_bytes(os.path.join(span_dir, 'prompt.json')))
+            except FileNotFoundError:
+                # Spans without both span.txt and prompt.json are skipped
+                return None
+            return {
                 'id': str(item),
                 'content': content,
                 'base_scene': prompt_data.get('base_scene', ''),
                 'scene': prompt_data.get('scene', ''),
                 'prompt': prompt_data.get('prompt', '')
-            })
+            }
+
+        # Iterate through all numerically named subfolders
+        def list_span_dirs():
+            with os.scandir(chapter_dir) as it:
+                return [entry.name for entry in it
+                        if entry.name.isdigit() and entry.is_dir()]
+
+        span_items = sorted(await asyncio.to_thread(list_span_dirs), key=int)
+        # gather keeps the input order, so results stay sorted by span id
+        spans = await asyncio.gather(*[asyncio.to_thread(load_span, item) for item in span_items])
+        scene_list = [span for span in spans if span is not None]
 
         return make_response(status='success', data=scene_list)
 
@@ -301,7 +375,7 @@ async def get_chapter_scene_list(project_name: str, chapter_name: str):
 
 
 @router.post('/translate_prompt')
-async def translate_prompt(request: Request):
+async def translate_prompt(body: TranslatePromptReq):
     """
     Convert scene description to AI drawing prompts
     Request parameters:
@@ -311,17 +385,7 @@ async def translate_prompt(request: Request):
         List of prompts
     """
     try:
-        data = await request.json()
-        project_name = data.get('project_name')
-        prompts = data.get('prompts', [])
-
-        if not project_name or not prompts:
-            return make_response(status='error', msg='Missing required parameters')
-
-        if not isinstance(prompts, list):
-            return make_response(status='error', msg='prompts must be a list')
-
-        translated_prompts = await llm_service.translate_prompt(project_name, prompts)
+        translated_prompts = await llm_service.translate_prompt(body.project_name, body.prompts)
         return make_response(data=translated_prompts, msg='Prompt translation successful')
 
     except Exception as e:
@@ -329,53 +393,53 @@ async def translate_prompt(request: Request):
         return make_response(status='error', msg=f'Failed to convert prompts: {str(e)}')
 
 
+def _write_scene(scene_dir: str, scene: Dict[str, Any]) -> None:
+    """Write span.txt and prompt.json for one scene"""
+    # Create scene directory (if it doesn't exist)
+    os.makedirs(scene_dir, exist_ok=True)
+
+    # Save split segments
+    if 'span' in scene:
+        with open(os.path.join(scene_dir, 'span.txt'), 'w', encoding='utf-8') as f:
+            f.write(scene['span'])
+
+    # Save scene description and prompts
+    if 'scene' in scene or 'prompt' in scene:
+        prompt_data = {
+            'base_scene': scene.get('base_scene', ''),
+            'scene': scene.get('scene', ''),
+            'prompt': scene.get('prompt', '')
+        }
+        with open(os.path.join(scene_dir, 'prompt.json'), 'wb') as f:
+            f.write(orjson.dumps(prompt_data, option=orjson.OPT_INDENT_2))
+
+
 @router.post('/save_scenes')
-async def save_scenes(request: Request):
+async def save_scenes(body: SaveScenesReq, projects_path: str = Depends(get_projects_path)):
     """
     Save scene modifications
     """
     try:
-        data = await request.json()
-        project_name = data.get('project_name')
-        chapter_name = data.get('chapter_name')
-        scenes = data.get('scenes')
-
-        if not all([project_name, chapter_name, scenes]):
-            return make_response(status='error', msg='Missing required parameters')
+        project_name = body.project_name
+        chapter_name = body.chapter_name
+        scenes = body.scenes
 
         # Get chapter directory
-        config = load_config()
-        chapter_dir = os.path.join(
-            config['projects_path'], project_name, chapter_name)
-        if not os.path.exists(chapter_dir):
+        chapter_dir = os.path.join(projects_path, project_name, chapter_name)
+        if not await asyncio.to_thread(os.path.exists, chapter_dir):
             return make_response(status='error', msg='Chapter does not exist')
-        print("Scenes: ", scenes)
-        # Save modifications for each scene
+        logger.debug("Scenes: %s", scenes)
+        # Save modifications for each scene; a repeated id keeps its last entry
+        scene_dirs = {}
         for scene in scenes:
             # Use scene number
             scene_index = scene.get('id')
             if not scene_index:
                 continue
+            scene_dirs[os.path.join(chapter_dir, str(scene_index))] = scene
 
-            scene_dir = os.path.join(chapter_dir, str(scene_index))
-
-            # Create scene directory (if it doesn't exist)
-            os.makedirs(scene_dir, exist_ok=True)
-
-            # Save split segments
-            if 'span' in scene:
-                with open(os.path.join(scene_dir, 'span.txt'), 'w', encoding='utf-8') as f:
-                    f.write(scene['span'])
-
-            # Save scene description and prompts
-            if 'scene' in scene or 'prompt' in scene:
-                prompt_data = {
-                    'base_scene': scene.get('base_scene', ''),
-                    'scene': scene.get('scene', ''),
-                    'prompt': scene.get('prompt', '')
-                }
-                with open(os.path.join(scene_dir, 'prompt.json'), 'w', encoding='utf-8') as f:
-                    json.dump(prompt_data, f, ensure_ascii=False, indent=2)
+        await asyncio.gather(*[asyncio.to_thread(_write_scene, scene_dir, scene)
+                               for scene_dir, scene in scene_dirs.items()])
 
         return make_response(status='success', msg='Save successful')
 
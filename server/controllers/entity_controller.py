@@ -1,17 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
-import json
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 import os
+import asyncio
 import logging
-import shutil
-from pathlib import Path
 from server.services.kg_service import KGService
 from server.services.scene_service import SceneService
-from server.utils.response import make_response
-from server.config.config import load_config
+from server.utils.response import make_response, PROJECT_MISSING
+from server.utils.fastrm import fast_rmtree
+from server.config.config import get_projects_path
+from pydantic import BaseModel, Field
+from typing import Any, Dict
 
 router = APIRouter(prefix='/entity')
 kg_service = KGService()
 scene_service = SceneService()
+# KG/scene mutations run in worker threads, serialized per project inside each service;
+# KG writes to disk are debounced by kg_service.schedule_save
+
+
+class CharacterReq(BaseModel):
+    project_name: str = Field(..., min_length=1)
+    name: str
+    attributes: Dict[str, Any] = {}
+
+
+class ToggleLockReq(BaseModel):
+    project_name: str = Field(..., min_length=1)
+    entity_name: str
+
+
+class SceneReq(BaseModel):
+    project_name: str = Field(..., min_length=1)
+    name: str
+    prompt: str = ""
+
+
+def _remove_reference_folder(folder: str, kind: str):
+    """Background task: delete an entity's reference image folder if it exists"""
+    try:
+        fast_rmtree(folder)
+        logging.info(f"Successfully deleted {kind} folder: {folder}")
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    except Exception as e:
+        # Entity is already gone from the KG, only log the leftover folder
+        logging.error(f"Failed to delete {kind} reference folder {folder}: {e}")
 
 
 @router.get('/character/list')
@@ -19,15 +51,14 @@ async def get_characters(project_name: str = Query(..., description="Project nam
     """Retrieve all character information for a project"""
     try:
         if not project_name:
-            return make_response(status='error', msg='Project does not exist')
+            return PROJECT_MISSING()
 
-        # Get entity list
-        characters = kg_service.inquire_entity_list(project_name)
-        characters = json.loads(characters) if isinstance(
-            characters, str) else characters
+        def load_characters():
+            # Get entity list and locked entities
+            return (kg_service.inquire_entity_list(project_name),
+                    kg_service.get_locked_entities(project_name))
 
-        # Get locked entities
-        locked_entities = kg_service.get_locked_entities(project_name)
+        characters, locked_entities = await asyncio.to_thread(load_characters)
 
         return make_response(data={
             'characters': characters,
@@ -38,46 +69,42 @@ async def get_characters(project_name: str = Query(..., description="Project nam
 
 
 @router.post('/character/update')
-async def update_character(request: Request):
+async def update_character(body: CharacterReq):
     """Update character information"""
     try:
-        data = await request.json()
-        project_name = data.get('project_name')
-        name = data.get('name')
-        attributes = data.get('attributes', {})
-
-        if not project_name:
-            return make_response(status='error', msg='Project does not exist')
+        project_name = body.project_name
+        name = body.name
+        attributes = body.attributes
 
         # Update entity attributes using kg_service and save
-        result = kg_service.modify_entity(
-            project_name, name, attributes, save_kg=True)
+        result = await asyncio.to_thread(
+            kg_service.modify_entity, project_name, name, attributes, save_kg=False)
+        kg_service.schedule_save(project_name)
         return make_response(data=result)
     except Exception as e:
         return make_response(status='error', msg=str(e))
 
 
 @router.post('/character/toggle_lock')
-async def toggle_lock(request: Request):
+async def toggle_lock(body: ToggleLockReq):
     """Toggle entity prompt lock"""
     try:
-        data = await request.json()
-        project_name = data.get('project_name')
-        entity_name = data.get('entity_name')
-
-        if not project_name:
-            return make_response(status='error', msg='Project does not exist')
+        project_name = body.project_name
+        entity_name = body.entity_name
 
         # Toggle entity lock using kg_service and save
-        is_locked = kg_service.toggle_entity_lock(
-            project_name, entity_name, save_kg=True)
+        is_locked = await asyncio.to_thread(
+            kg_service.toggle_entity_lock, project_name, entity_name, save_kg=False)
+        kg_service.schedule_save(project_name)
         return make_response(data={'is_locked': is_locked})
     except Exception as e:
         return make_response(status='error', msg=str(e))
 
 
 @router.delete('/character/{name}')
-async def delete_character(name: str, project_name: str = Query(..., description="Project name")):
+async def delete_character(name: str, background_tasks: BackgroundTasks,
+                           project_name: str = Query(..., description="Project name"),
+                           projects_path: str = Depends(get_projects_path)):
     """
     Delete a character entity
 
@@ -89,31 +116,25 @@ async def delete_character(name: str, project_name: str = Query(..., description
     """
     try:
         if not project_name:
-            return make_response(status='error', msg='Project does not exist')
+            return PROJECT_MISSING()
 
         # Delete entity and save
-        result = kg_service.delete_entity(project_name, name, save_kg=True)
-
-        # Delete corresponding reference image folder
-        try:
-            config = load_config()
-            projects_path = config.get('projects_path', 'projects')
-            character_folder = Path(projects_path) / \
-                project_name / "Character" / name
-            if character_folder.exists() and character_folder.is_dir():
-                shutil.rmtree(character_folder)
-                logging.info(
-                    f"Successfully deleted character folder: {character_folder}")
-        except Exception as folder_e:
-            # Log folder deletion failure but continue
-            logging.error(
-                f"Failed to delete character reference folder {name}: {folder_e}")
-
-        # Check deletion result
-        if '成功' in result:
-            return make_response(data=True)
-        else:
-            return make_response(status='error', msg=result)
+        result = await asyncio.to_thread(
+            kg_service.delete_entity, project_name, name, save_kg=False)
+        kg_service.schedule_save(project_name)
+
+        # Check deletion result; a locked entity keeps its reference images
+        if not result['ok']:
+            return make_response(status='error', msg=result['msg'])
+
+        # Delete corresponding reference image folder after the response is sent;
+        # no existence check here, the task treats a missing folder as done
+        character_folder = os.path.join(
+            projects_path, project_name, "Character", name)
+        background_tasks.add_task(
+            _remove_reference_folder, character_folder, 'character')
+
+        return make_response(data=True)
 
     except Exception as e:
         logging.error(f"Error deleting entity: {str(e)}")
@@ -125,11 +146,10 @@ async def get_scenes(project_name: str = Query(..., description="Project name"))
     """Retrieve all base scene information for a project"""
     try:
         if not project_name:
-            return make_response(status='error', msg='Project does not exist')
+            return PROJECT_MISSING()
 
         # Get scene list
-        scenes = scene_service.load_scenes(project_name)
-        scenes = json.loads(scenes) if isinstance(scenes, str) else scenes
+        scenes = await asyncio.to_thread(scene_service.load_scenes, project_name)
 
         return make_response(data={
             'scenes': scenes,
@@ -139,26 +159,24 @@ async def get_scenes(project_name: str = Query(..., description="Project name"))
 
 
 @router.post('/scene/update')
-async def update_scenes(request: Request):
+async def update_scenes(body: SceneReq):
     """Update scene information"""
     try:
-        data = await request.json()
-        project_name = data.get('project_name')
-        name = data.get('name')
-        prompt = data.get('prompt', "")
+        project_name = body.project_name
+        name = body.name
+        prompt = body.prompt
 
-        if not project_name:
-            return make_response(status='error', msg='Project does not exist')
-
-        result = scene_service.update_scenes(
-            project_name, {name: prompt}, force_update=True)
+        result = await asyncio.to_thread(
+            scene_service.update_scenes, project_name, {name: prompt}, force_update=True)
         return make_response(data=result)
     except Exception as e:
         return make_response(status='error', msg=str(e))
 
 
 @router.delete('/scene/{name}')
-async def delete_scene(name: str, project_name: str = Query(..., description="Project name")):
+async def delete_scene(name: str, background_tasks: BackgroundTasks,
+                       project_name: str = Query(..., description="Project name"),
+                       projects_path: str = Depends(get_projects_path)):
     """
     Delete a scene entity
 
@@ -170,29 +188,19 @@ async def delete_scene(name: str, project_name: str = Query(..., description="Pr
     """
     try:
         if not project_name:
-            return make_response(status='error', msg='Project does not exist')
-
-        result = scene_service.delete_scenes(project_name, [name])
-
-        # Delete corresponding reference image folder
-        try:
-            config = load_config()
-            projects_path = config.get('projects_path', 'projects')
-            scene_folder = Path(projects_path) / project_name / "Scene" / name
-            if scene_folder.exists() and scene_folder.is_dir():
-                shutil.rmtree(scene_folder)
-                logging.info(
-                    f"Successfully deleted scene folder: {scene_folder}")
-        except Exception as folder_e:
-            # Log folder deletion failure but continue
-            logging.error(
-                f"Failed to delete scene reference folder {name}: {folder_e}")
-
-        # Check deletion result
-        if result:
-            return make_response(data=result)
-        else:
-            return make_response(status='error', msg=result)
+            return PROJECT_MISSING()
+
+        # delete_scenes returns True or raises
+        await asyncio.to_thread(
+            scene_service.delete_scenes, project_name, [name])
+
+        # Delete corresponding reference image folder after the response is sent;
+        # no existence check here, the task treats a missing folder as done
+        scene_folder = os.path.join(projects_path, project_name, "Scene", name)
+        background_tasks.add_task(
+            _remove_reference_folder, scene_folder, 'scene')
+
+        return make_response(data=True)
 
     except Exception as e:
         logging.error(f"Error deleting entity: {str(e)}")
@@ -200,20 +208,17 @@ async def delete_scene(name: str, project_name: str = Query(..., description="Pr
 
 
 @router.post('/character/create')
-async def create_character(request: Request):
+async def create_character(body: CharacterReq):
     """Create a new character entity"""
     try:
-        data = await request.json()
-        project_name = data.get('project_name')
-        name = data.get('name')
-        attributes = data.get('attributes', {})
-
-        if not project_name:
-            return make_response(status='error', msg='Project does not exist')
+        project_name = body.project_name
+        name = body.name
+        attributes = body.attributes
 
         # Create new entity using kg_service and save
-        result = kg_service.new_entity(
-            project_name, name, attributes, save_kg=True)
+        result = await asyncio.to_thread(
+            kg_service.new_entity, project_name, name, attributes, save_kg=False)
+        kg_service.schedule_save(project_name)
         return make_response(data=result)
     except Exception as e:
         logging.error(f"Error creating entity: {str(e)}")
@@ -221,21 +226,17 @@ async def create_character(request: Request):
 
 
 @router.post('/scene/create')
-async def create_scene(request: Request):
+async def create_scene(body: SceneReq):
     """Create a new scene"""
     try:
-        data = await request.json()
-        project_name = data.get('project_name')
-        name = data.get('name')
-        prompt = data.get('prompt', "")
-
-        if not project_name:
-            return make_response(status='error', msg='Project does not exist')
+        project_name = body.project_name
+        name = body.name
+        prompt = body.prompt
 
         # Create new scene using scene_service and save
         scene_dict = {name: prompt}
-        result = scene_service.update_scenes(
-            project_name, scene_dict, force_update=True)
+        result = await asyncio.to_thread(
+            scene_service.update_scenes, project_name, scene_dict, force_update=True)
         return make_response(data=result)
     except Exception as e:
         logging.error(f"Error creating scene: {str(e)}")
@@ -1,39 +1,116 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query, Body
 from fastapi.responses import FileResponse
-from server.config.config import load_config, get_prompt_style_by_name
+from server.config.config import current_config, get_prompt_style_by_name
 from server.services.image_service import ImageService
 from server.services.audio_service import AudioService
 from server.utils.response import make_response
 import os
+import asyncio
 import datetime
 import logging
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
 
-config = load_config()
 router = APIRouter(prefix='/media')
 image_service = ImageService()
 audio_service = AudioService()
 logger = logging.getLogger(__name__)
 
 
+def _prepare_span_dirs(chapter_path: str, span_ids: List) -> List[str]:
+    """Create the output directory of every span, returned in span order"""
+    chapter_root = os.path.join(chapter_path, "")
+    output_dirs = [chapter_root + str(span_id) for span_id in span_ids]
+    for span_path in output_dirs:
+        os.makedirs(span_path, exist_ok=True)
+    # One summary line per batch rather than one per span
+    logger.info("Prepared %d output directories under %s",
+                len(output_dirs), chapter_path)
+    return output_dirs
+
+
+def _existing_reference_images(root: str, names: set, image_suffix: str) -> set:
+    """Names under root that have a reference image: one scandir, then one stat per distinct name"""
+    try:
+        with os.scandir(root) as it:
+            dirs = {entry.name for entry in it
+                    if entry.name in names and entry.is_dir()}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
+    return {name for name in dirs if os.path.isfile(root + name + image_suffix)}
+
+
+def _resolve_reference_images(char_root: str, scene_root: str, infos: List[Dict[str, Any]], image_suffix: str):
+    """Characters and scenes referenced by infos whose reference image exists"""
+    characters = {info[key] for info in infos for key in ('character1', 'character2')
+                  if info.get(key)}
+    scenes = {info['scene'] for info in infos if info.get('scene')}
+    return (_existing_reference_images(char_root, characters, image_suffix),
+            _existing_reference_images(scene_root, scenes, image_suffix))
+
+
+class GenerateImagesReq(BaseModel):
+    project_name: str = Field(..., min_length=1)
+    chapter_name: str = Field(..., min_length=1)
+    prompts: List[Dict[str, Any]] = Field(..., min_length=1)
+    imageSettings: Dict[str, Any] = {}
+    reference_image_infos: Optional[List[Dict[str, Any]]] = None
+    workflow: Optional[str] = None
+
+
+class GenerateAudioReq(BaseModel):
+    project_name: str = Field(..., min_length=1)
+    chapter_name: str = Field(..., min_length=1)
+    prompts: List[Dict[str, Any]] = Field(..., min_length=1)
+    audioSettings: Dict[str, Any] = {}
+
+
+class CancelReq(BaseModel):
+    task_id: str = Field(..., min_length=1)
+
+
+# Media is regenerated in place, so clients must revalidate (cheap with the ETag)
+MEDIA_CACHE_CONTROL = 'no-cache'
+
+
+async def _file_response(request: Request, path: str, media_type: str, missing_msg: str):
+    """
+    Serve a media file from a single stat
+
+    Passing stat_result lets FileResponse skip its own stat and emit ETag/Last-Modified;
+    a matching If-None-Match is answered with 304 without touching the file body.
+    """
+    try:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except (FileNotFoundError, NotADirectoryError):
+        return make_response(status='error', msg=missing_msg)
+
+    response = FileResponse(path, media_type=media_type, stat_result=stat_result,
+                            headers={'Cache-Control': MEDIA_CACHE_CONTROL})
+    etag = response.headers.get('etag')
+    if etag and etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers={
+            'ETag': etag, 'Cache-Control': MEDIA_CACHE_CONTROL})
+    return response
+
+
 @router.post('/generate_images')
-async def generate_images(request: Request):
+async def generate_images(body: GenerateImagesReq):
     """Generate images API"""
     try:
-        data = await request.json()
+        config = current_config()
 
         # Get project, chapter, and prompt information
-        project_name = data.get('project_name')
-        chapter_name = data.get('chapter_name')
-        prompts = data.get('prompts')
-        image_settings = data.get('imageSettings')
-        reference_image_infos = data.get('reference_image_infos')
+        project_name = body.project_name
+        chapter_name = body.chapter_name
+        prompts = body.prompts
+        image_settings = body.imageSettings
+        reference_image_infos = body.reference_image_infos
 
-        if not all([project_name, chapter_name, prompts]):
-            return make_response(status='error', msg='Missing required parameters: project_name, chapter_name, prompts')
+        reference_image_mode = config.get('comfyui', {}).get('reference_image_mode', True)
 
         # Get workflow and parameters
-        workflow = data.get('workflow', config.get(
-            'default_workflow', {}).get('name', 'default_workflow.json'))
+        workflow = body.workflow or config.get('default_workflow', {}).get('name', 'default_workflow.json')
         params = {}
         width = image_settings.get('width', 512)
         height = image_settings.get('height', 768)
@@ -55,51 +132,48 @@ async def generate_images(request: Request):
         if negative_prompt:
             params['negative_prompt'] = negative_prompt
 
-        reference_image_paths = []
-        if config['comfyui'].get('reference_image_mode', True) and reference_image_infos:
-            for info in reference_image_infos:
-                character1 = info.get('character1', '')
-                character2 = info.get('character2', '')
-                scene = info.get('scene', '')
-                path1 = os.path.join(config['projects_path'], project_name,
-                                     "Character", character1, "image.png") if character1 else ''
-                path2 = os.path.join(config['projects_path'], project_name,
-                                     "Character", character2, "image.png") if character2 else ''
-                path3 = os.path.join(
-                    config['projects_path'], project_name, "Scene", scene, "image.png") if scene else ''
-                reference_image_paths.append((path1, path2, path3))
+        # Join the project root once; per-entity paths are plain concatenation
+        project_root = os.path.join(config['projects_path'], project_name)
+
+        if reference_image_mode and reference_image_infos:
+            char_root = os.path.join(project_root, "Character", "")
+            scene_root = os.path.join(project_root, "Scene", "")
+            image_suffix = os.sep + "image.png"
+            # Check each distinct entity once instead of letting the worker hit missing files per span
+            have_char, have_scene = await asyncio.to_thread(
+                _resolve_reference_images, char_root, scene_root, reference_image_infos, image_suffix)
+            # (character1, character2, scene) image paths, '' where the info has no such entity or image
+            reference_image_paths = [
+                (char_root + info['character1'] + image_suffix if info.get('character1') in have_char else '',
+                 char_root + info['character2'] + image_suffix if info.get('character2') in have_char else '',
+                 scene_root + info['scene'] + image_suffix if info.get('scene') in have_scene else '')
+                for info in reference_image_infos
+            ]
 
             # Use this workflow when reference images are provided
             workflow = "nunchaku-flux-kontext-multi-images.json"
             params['reference_image_paths'] = reference_image_paths
 
-        # Build output path array
-        output_dirs = []
-        processed_prompts = []
-        for prompt_data in prompts:
-            span_id = prompt_data.get('id', '')
-
-            # Build output path (consistent with image retrieval)
-            span_path = os.path.join(
-                config['projects_path'], project_name, chapter_name, str(span_id))
-            output_dirs.append(span_path)
-
-            # Ensure directory exists
-            os.makedirs(span_path, exist_ok=True)
-            logger.info(f"Created output directory: {span_path}")
-
-            # Get original prompt
-            prompt_text = prompt_data.get('prompt', '')
-
-            # Apply style template if available
-            processed_prompt = style_template.replace(
-                '{prompt}', prompt_text) if style_template and '{prompt}' in style_template else prompt_text
-            processed_prompts.append(processed_prompt)
+        # Apply style template if available; the template is split once, then
+        # joining its pieces with each prompt is the same as replacing every slot
+        if style_template and '{prompt}' in style_template:
+            template_parts = style_template.split('{prompt}')
+            processed_prompts = [prompt_data.get('prompt', '').join(template_parts)
+                                 for prompt_data in prompts]
+        else:
+            processed_prompts = [prompt_data.get('prompt', '')
+                                 for prompt_data in prompts]
 
         # Validate prompts
         if not all(processed_prompts):
             return make_response(status='error', msg='Empty prompt field found in prompts')
 
+        # Build output path array (consistent with image retrieval), creating all directories in one thread hop
+        output_dirs = await asyncio.to_thread(
+            _prepare_span_dirs,
+            os.path.join(project_root, chapter_name),
+            [prompt_data.get('id', '') for prompt_data in prompts])
+
         try:
             # Call image service to generate images
             result = image_service.generate_images(
@@ -122,32 +196,24 @@ async def generate_images(request: Request):
 
 
 @router.post('/generate-audio')
-async def generate_audio(request: Request):
+async def generate_audio(body: GenerateAudioReq, request: Request):
     """Generate audio files API"""
     try:
-        data = await request.json()
+        config = request.app.state.config
 
         # Get project, chapter, and prompt information
-        project_name = data.get('project_name')
-        chapter_name = data.get('chapter_name')
-        prompts = data.get('prompts')
-        audio_settings = data.get('audioSettings', {})
-
-        if not all([project_name, chapter_name, prompts]):
-            return make_response(status='error', msg='Missing required parameters: project_name, chapter_name, prompts')
+        project_name = body.project_name
+        chapter_name = body.chapter_name
+        prompts = body.prompts
+        audio_settings = body.audioSettings
 
-        # Build output path array
-        output_dirs = []
+        span_ids = []
         prompt_texts = []
         for prompt_data in prompts:
             span_id = prompt_data.get('id')
             if span_id is None:
                 return make_response(status='error', msg='Missing id field in prompts')
-
-            # Build output path
-            span_path = os.path.join(
-                config['projects_path'], project_name, chapter_name, str(span_id))
-            output_dirs.append(span_path)
+            span_ids.append(span_id)
 
             # Extract prompt text
             prompt_text = prompt_data.get('prompt')
@@ -155,6 +221,12 @@ async def generate_audio(request: Request):
                 return make_response(status='error', msg='Empty prompt field found in prompts')
             prompt_texts.append(prompt_text)
 
+        # Build output path array, creating all directories in one thread hop
+        output_dirs = await asyncio.to_thread(
+            _prepare_span_dirs,
+            os.path.join(config['projects_path'], project_name, chapter_name),
+            span_ids)
+
         try:
             rate = audio_settings.get('rate', '+0%')
             if rate == '0%':
@@ -206,11 +278,10 @@ async def get_generation_progress(task_id: str = Query(..., description="Task ID
 
 
 @router.post('/cancel')
-async def cancel_generation(request: Request):
+async def cancel_generation(body: CancelReq):
     """Cancel generation task"""
     try:
-        data = await request.json()
-        task_id = data.get("task_id")
+        task_id = body.task_id
         logger.info(f"Preparing to cancel task: {task_id}")
 
         # Determine if it's an image or audio task based on task ID prefix
@@ -257,15 +328,16 @@ async def get_workflow(workflow_name: str):
 
 
 @router.get('/get_image')
-async def get_media_image(project_name: str, chapter_name: str, span_id: str):
+async def get_media_image(request: Request, project_name: str, chapter_name: str, span_id: str):
     """Retrieve image for a specific project chapter span"""
     try:
+        config = request.app.state.config
         # Build image path (consistent with generation)
         image_path = os.path.join(
             config['projects_path'], project_name, chapter_name, str(span_id), 'image.png')
-        logger.info(f"Trying to access image at: {image_path}")
+        logger.debug("Trying to access image at: %s", image_path)
 
-        return FileResponse(image_path, media_type='image/png')
+        return await _file_response(request, image_path, 'image/png', 'Image does not exist')
 
     except Exception as e:
         logger.error(f"Error accessing image: {str(e)}")
@@ -273,17 +345,15 @@ async def get_media_image(project_name: str, chapter_name: str, span_id: str):
 
 
 @router.get('/get_audio')
-async def get_media_audio(project_name: str, chapter_name: str, span_id: str):
+async def get_media_audio(request: Request, project_name: str, chapter_name: str, span_id: str):
     """Retrieve audio for a specific project chapter span"""
     try:
+        config = request.app.state.config
         # Build audio path
         audio_path = os.path.join(
             config['projects_path'], project_name, chapter_name, str(span_id), 'audio.mp3')
 
-        if not os.path.exists(audio_path):
-            return make_response(status='error', msg='Audio does not exist')
-
-        return FileResponse(audio_path, media_type='audio/mpeg')
+        return await _file_response(request, audio_path, 'audio/mpeg', 'Audio does not exist')
 
     except Exception as e:
         logger.error(f"Error accessing audio: {str(e)}")
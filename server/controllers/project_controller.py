@@ -1,58 +1,178 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 import os
 # from server.services.chapter_file_service import ChapterFileService
 from server.services.llm_service import LLMService
-from server.config.config import load_config
-import json
+from server.services.kg_service import KGService
+from server.config.config import get_projects_path
 from datetime import datetime
-from server.utils.response import make_response
-import shutil
+from server.utils.file_io import JSON_WRITE_OPTIONS, write_bytes
+from server.utils.fastrm import fast_rmtree
+from server.utils.response import make_response, PROJECT_MISSING
+import asyncio
+import orjson
+import re
+from pydantic import BaseModel, Field
+from typing import Optional
 
 router = APIRouter(prefix='/project')
+kg_service = KGService()
 
 
-@router.post('/create')
-async def create_project(request: Request):
-    """Create a new project"""
-    try:
-        data = await request.json()
-        project_name = data.get('project_name')
+class CreateProjectReq(BaseModel):
+    project_name: str = Field(..., min_length=1)
 
-        if not project_name:
-            return make_response(status='error', msg='Project name cannot be empty')
 
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
+class UpdateProjectReq(BaseModel):
+    old_name: str = Field(..., min_length=1)
+    new_name: str = Field(..., min_length=1)
 
-        # Create project directory
-        project_path = os.path.join(projects_path, project_name)
-        if os.path.exists(project_path):
-            return make_response(status='error', msg='Project already exists')
 
+class CreateFromStoryReq(BaseModel):
+    # Empty values are reported by the handler with its own messages
+    project_name: str = ''
+    story_content: str = ''
+
+IMG_RE = re.compile(r'\.(?:png|jpe?g|gif)$', re.IGNORECASE)
+AUDIO_RE = re.compile(r'\.wav$', re.IGNORECASE)
+
+# Files of a new project, serialized once at import
+EMPTY_KG_JSON = orjson.dumps({
+    'locked_entities': [],
+    'relationships': [],
+    'entities': []
+}, option=JSON_WRITE_OPTIONS)
+EMPTY_SCENES_JSON = orjson.dumps({}, option=JSON_WRITE_OPTIONS)
+
+# KG responses change rarely, so clients revalidate them with the ETag
+KG_CACHE_CONTROL = 'no-cache'
+
+
+def _scan_span(span_entry) -> dict:
+    """Classify a span directory's files in a single scandir pass, without lowercasing each name"""
+    span_info = {
+        'id': span_entry.name,
+        'has_content': False,
+        'has_prompt': False,
+        'images': [],
+        'audios': []
+    }
+    with os.scandir(span_entry.path) as it:
+        for entry in it:
+            name = entry.name
+            if IMG_RE.search(name):
+                span_info['images'].append(name)
+            elif AUDIO_RE.search(name):
+                span_info['audios'].append(name)
+            elif name == 'span.txt':
+                span_info['has_content'] = True
+            elif name == 'prompt.txt':
+                span_info['has_prompt'] = True
+    return span_info
+
+
+def _numeric_key(name: str, skip: int = 0) -> tuple:
+    """Sort key putting chapter2 before chapter10; names without a number sort after, by name"""
+    suffix = name[skip:]
+    return (0, int(suffix), '') if suffix.isdigit() else (1, 0, name)
+
+
+def _list_chapters(project_path: str) -> list:
+    """Chapter directory entries in chapter order; DirEntry types avoid a stat per entry"""
+    with os.scandir(project_path) as it:
+        return sorted(
+            (e for e in it if e.name.startswith('chapter') and e.is_dir()),
+            key=lambda e: _numeric_key(e.name, 7))  # strip "chapter" prefix
+
+
+def _scan_chapter(chapter_entry) -> dict:
+    """A chapter and its spans, in span order"""
+    with os.scandir(chapter_entry.path) as it:
+        span_entries = sorted(
+            (e for e in it if e.is_dir()), key=lambda e: _numeric_key(e.name))
+    return {
+        'id': chapter_entry.name,
+        'spans': [_scan_span(span_entry) for span_entry in span_entries]
+    }
+
+
+async def _scan_chapters(project_path: str, with_spans: bool = True) -> list:
+    """Scan chapters concurrently in worker threads; each one blocks on its own scandir calls"""
+    chapter_entries = await asyncio.to_thread(_list_chapters, project_path)
+    if not with_spans:
+        return [{'id': chapter_entry.name, 'spans': []} for chapter_entry in chapter_entries]
+    return list(await asyncio.gather(*(
+        asyncio.to_thread(_scan_chapter, chapter_entry) for chapter_entry in chapter_entries)))
+
+
+def _etag(*stats: os.stat_result) -> str:
+    """Weak validator from the mtime and size of what a response is built from"""
+    return 'W/"' + '-'.join(f'{st.st_mtime_ns:x}-{st.st_size:x}' for st in stats) + '"'
+
+
+def _not_modified(etag: str) -> Response:
+    """Empty 304 for a client whose cached copy is current"""
+    return Response(status_code=304, headers={
+        'ETag': etag, 'Cache-Control': KG_CACHE_CONTROL})
+
+
+def _with_etag(response: Response, etag: str) -> Response:
+    """Attach the validator so the next GET can be conditional"""
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = KG_CACHE_CONTROL
+    return response
+
+
+def _init_project(project_path: str, first_chapter: Optional[str] = None) -> None:
+    """Create the project directory with an empty knowledge graph and scene file
+
+    Raises FileExistsError if the project already exists. With first_chapter,
+    an empty chapter is created in the same worker-thread call.
+    """
+    try:
+        # One mkdir in the common case; makedirs would stat the parent first
+        os.mkdir(project_path)
+    except FileNotFoundError:
         os.makedirs(project_path)
 
-        # Create empty knowledge graph file
-        kg_path = os.path.join(project_path, 'kg.json')
-        with open(kg_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                'locked_entities': [],
-                'relationships': [],
-                'entities': []
-            }, f, ensure_ascii=False, indent=2)
+    # Create empty knowledge graph file
+    prefix = project_path + os.sep
+    write_bytes(prefix + 'kg.json', EMPTY_KG_JSON)
 
-        scenes_path = os.path.join(project_path, 'scenes.json')
-        with open(scenes_path, 'w', encoding='utf-8') as f:
-            json.dump({}, f, ensure_ascii=False, indent=2)
+    # Create empty scenes file
+    write_bytes(prefix + 'scenes.json', EMPTY_SCENES_JSON)
 
-        # Automatically create first chapter
-        first_chapter = 'chapter1'
-        first_chapter_path = os.path.join(project_path, first_chapter)
+    if first_chapter:
+        _write_chapter(project_path, first_chapter, '')
 
-        # Create new chapter directory and content.txt file
-        os.makedirs(first_chapter_path, exist_ok=True)
-        content_file = os.path.join(first_chapter_path, 'content.txt')
-        with open(content_file, 'w', encoding='utf-8') as f:
-            f.write('')
+
+def _write_chapter(project_path: str, chapter_name: str, content: str) -> None:
+    """Create a chapter directory with its content.txt; one worker-thread call per chapter"""
+    chapter_path = project_path + os.sep + chapter_name
+    # Chapters are only written into a project _init_project just created
+    os.mkdir(chapter_path)
+    with open(chapter_path + os.sep + 'content.txt', 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def _list_projects(projects_path: str) -> list:
+    """Names of the project directories"""
+    with os.scandir(projects_path) as it:
+        return [entry.name for entry in it if entry.is_dir()]
+
+
+@router.post('/create')
+async def create_project(body: CreateProjectReq, projects_path: str = Depends(get_projects_path)):
+    """Create a new project"""
+    try:
+        project_name = body.project_name
+
+        # Create project directory and automatically create first chapter
+        project_path = os.path.join(projects_path, project_name)
+        first_chapter = 'chapter1'
+        try:
+            await asyncio.to_thread(_init_project, project_path, first_chapter)
+        except FileExistsError:
+            return make_response(status='error', msg='Project already exists')
 
         return make_response(
             data={
@@ -66,106 +186,83 @@ async def create_project(request: Request):
 
 
 @router.get('/info')
-async def get_project_info(project_name: str):
-    """Retrieve project information"""
+async def get_project_info(request: Request, project_name: str, detail: str = 'light',
+                           projects_path: str = Depends(get_projects_path)):
+    """
+    Retrieve project information; span listings are only scanned with detail=full
+
+    A light response only depends on the project directory entries and kg.json,
+    so it carries an ETag built from their stats and conditional GETs get a 304.
+    """
     if not project_name:
         return make_response(status='error', msg='Project ID cannot be empty')
 
-    config = load_config()
-    projects_path = config.get('projects_path', 'projects/')
-
     # Build project path
     project_path = os.path.join(projects_path, project_name)
-    if not os.path.exists(project_path):
-        return make_response(status='error', msg='Project does not exist')
+    with_spans = detail == 'full'
 
     try:
-        # Get chapter list
-        chapters = []
-        for chapter_dir in sorted(os.listdir(project_path)):
-            if chapter_dir.startswith('chapter'):
-                chapter_path = os.path.join(project_path, chapter_dir)
-                if os.path.isdir(chapter_path):
-                    # Get chapter information
-                    spans = []
-                    for span_dir in sorted(os.listdir(chapter_path)):
-                        span_path = os.path.join(chapter_path, span_dir)
-                        if os.path.isdir(span_path):
-                            # Get span information
-                            span_info = {
-                                'id': span_dir,
-                                'has_content': os.path.exists(os.path.join(span_path, 'span.txt')),
-                                'has_prompt': os.path.exists(os.path.join(span_path, 'prompt.txt')),
-                                'images': [f for f in os.listdir(span_path) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))],
-                                'audios': [f for f in os.listdir(span_path) if f.lower().endswith('.wav')]
-                            }
-                            spans.append(span_info)
-
-                    chapters.append({
-                        'id': chapter_dir,
-                        'spans': spans
-                    })
-
-        # Get knowledge graph
-        kg_path = os.path.join(project_path, 'kg.json')
-        with open(kg_path, 'r', encoding='utf-8') as f:
-            knowledge_graph = json.load(f)
-
-        return make_response(
-            data={
-                'project_name': project_name,
-                'chapters': chapters,
-                'knowledge_graph': knowledge_graph
-            },
-            msg='Project information retrieved successfully'
-        )
+        # The graph comes from kg_service, with debounced edits written before kg.json is stat'ed
+        project_st, (knowledge_graph, kg_st) = await asyncio.to_thread(
+            lambda: (os.stat(project_path), kg_service.get_knowledge_graph(project_name)))
+        etag = None if with_spans else _etag(project_st, kg_st)
+        if etag and etag in request.headers.get('if-none-match', ''):
+            return _not_modified(etag)
+
+        chapters = await _scan_chapters(project_path, with_spans=with_spans)
     except Exception as e:
+        # Only look at the project directory once something is missing
+        if isinstance(e, FileNotFoundError) and not await asyncio.to_thread(os.path.isdir, project_path):
+            return PROJECT_MISSING()
         return make_response(status='error', msg=f'Error retrieving project information: {str(e)}')
 
+    response = make_response(
+        data={
+            'project_name': project_name,
+            'chapters': chapters,
+            'knowledge_graph': knowledge_graph
+        },
+        msg='Project information retrieved successfully'
+    )
+    return _with_etag(response, etag) if etag else response
+
 
 @router.get('/kg')
-async def get_knowledge_graph(project_name: str):
-    """Retrieve project knowledge graph"""
+async def get_knowledge_graph(request: Request, project_name: str):
+    """Retrieve project knowledge graph; an unchanged kg.json is answered with 304"""
     if not project_name:
         return make_response(status='error', msg='Project ID cannot be empty')
 
-    config = load_config()
-    projects_path = config.get('projects_path', 'projects/')
-
-    # Build knowledge graph file path
-    kg_path = os.path.join(projects_path, project_name, 'kg.json')
-    if not os.path.exists(kg_path):
-        return make_response(status='error', msg='Knowledge graph does not exist')
-
     try:
-        with open(kg_path, 'r', encoding='utf-8') as f:
-            knowledge_graph = json.load(f)
-
-        return make_response(
-            data={
-                'project_name': project_name,
-                'knowledge_graph': knowledge_graph
-            },
-            msg='Knowledge graph retrieved successfully'
-        )
+        # The graph comes from kg_service, with debounced edits written before kg.json is stat'ed
+        knowledge_graph, kg_st = await asyncio.to_thread(
+            kg_service.get_knowledge_graph, project_name)
+        etag = _etag(kg_st)
+        if etag in request.headers.get('if-none-match', ''):
+            return _not_modified(etag)
+    except FileNotFoundError:
+        return make_response(status='error', msg='Knowledge graph does not exist')
     except Exception as e:
         return make_response(status='error', msg=f'Error retrieving knowledge graph: {str(e)}')
 
+    return _with_etag(make_response(
+        data={
+            'project_name': project_name,
+            'knowledge_graph': knowledge_graph
+        },
+        msg='Knowledge graph retrieved successfully'
+    ), etag)
+
 
 @router.get('/list')
-async def get_project_list():
+async def get_project_list(projects_path: str = Depends(get_projects_path)):
     """Retrieve list of all projects"""
     try:
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
-
-        # Ensure project directory exists
-        if not os.path.exists(projects_path):
-            return make_response(status='error', msg='Project directory does not exist')
-
         # Get all project names (directory names)
-        project_names = [name for name in os.listdir(projects_path)
-                         if os.path.isdir(os.path.join(projects_path, name))]
+        try:
+            project_names = await asyncio.to_thread(_list_projects, projects_path)
+        except FileNotFoundError:
+            return make_response(status='error', msg='Project directory does not exist')
 
         return make_response(
             data=project_names,
@@ -176,31 +273,35 @@ async def get_project_list():
 
 
 @router.put('/update')
-async def update_project(request: Request):
+async def update_project(body: UpdateProjectReq, projects_path: str = Depends(get_projects_path)):
     """Update project name"""
     try:
-        data = await request.json()
-        old_name = data.get('old_name')
-        new_name = data.get('new_name')
-
-        if not all([old_name, new_name]):
-            return make_response(status='error', msg='Project name cannot be empty')
+        old_name = body.old_name
+        new_name = body.new_name
 
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
-
-        # Check if original project exists
         old_project_path = os.path.join(projects_path, old_name)
-        if not os.path.exists(old_project_path):
-            return make_response(status='error', msg='Project does not exist')
-
-        # Check if new name already exists
         new_project_path = os.path.join(projects_path, new_name)
-        if os.path.exists(new_project_path):
-            return make_response(status='error', msg='New project name already exists')
 
-        # Rename project directory
-        os.rename(old_project_path, new_project_path)
+        def rename_project():
+            # POSIX rename silently replaces an empty directory, so the target is still checked;
+            # a missing source is reported by rename itself
+            if os.path.exists(new_project_path):
+                return make_response(status='error', msg='New project name already exists')
+            # Rename project directory
+            try:
+                os.rename(old_project_path, new_project_path)
+            except FileNotFoundError:
+                return PROJECT_MISSING()
+            except FileExistsError:
+                # Windows, or the target appeared after the check
+                return make_response(status='error', msg='New project name already exists')
+
+        # Debounced KG edits must reach the old directory before it moves
+        await asyncio.to_thread(kg_service.flush_pending_saves, old_name)
+        error = await asyncio.to_thread(rename_project)
+        if error is not None:
+            return error
+        kg_service.discard_project(old_name)
 
         return make_response(
             data={'project_name': new_name},
@@ -211,19 +312,20 @@ async def update_project(request: Request):
 
 
 @router.delete('/delete/{project_name}')
-async def delete_project(project_name: str):
+async def delete_project(project_name: str, projects_path: str = Depends(get_projects_path)):
     """Delete a project"""
     try:
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
-
         # Build project path
         project_path = os.path.join(projects_path, project_name)
-        if not os.path.exists(project_path):
-            return make_response(status='error', msg='Project does not exist')
+
+        # A pending debounced save must not write into the deleted project
+        kg_service.discard_project(project_name)
 
         # Delete project directory and its contents
-        shutil.rmtree(project_path)
+        try:
+            await asyncio.to_thread(fast_rmtree, project_path)
+        except FileNotFoundError:
+            return PROJECT_MISSING()
 
         return make_response(msg='Project deleted successfully')
     except Exception as e:
@@ -231,57 +333,40 @@ async def delete_project(project_name: str):
 
 
 @router.post('/create_from_story')
-async def create_project_from_story(request: Request):
+async def create_project_from_story(request: Request, projects_path: str = Depends(get_projects_path)):
     """Create a new project and split story into chapters"""
     try:
-        data = await request.json()
-        project_name = data.get('project_name')
-        story_content = data.get('story_content')
+        # Stories can be large: accumulate the streamed body in one buffer and let
+        # pydantic-core parse and validate it in a single pass
+        body = bytearray()
+        async for chunk in request.stream():
+            body.extend(chunk)
+        data = CreateFromStoryReq.model_validate_json(body)
+        project_name = data.project_name
+        story_content = data.story_content
 
         if not project_name:
             return make_response(status='error', msg='Tên dự án không được để trống')
         if not story_content:
             return make_response(status='error', msg='Nội dung câu chuyện không được để trống')
 
-        config = load_config()
-        projects_path = config.get('projects_path', 'projects/')
-
         # Create project directory
         project_path = os.path.join(projects_path, project_name)
-        if os.path.exists(project_path):
+        try:
+            await asyncio.to_thread(_init_project, project_path)
+        except FileExistsError:
             return make_response(status='error', msg='Dự án đã tồn tại')
 
-        os.makedirs(project_path)
-
-        # Create empty knowledge graph file
-        kg_path = os.path.join(project_path, 'kg.json')
-        with open(kg_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                'locked_entities': [],
-                'relationships': [],
-                'entities': []
-            }, f, ensure_ascii=False, indent=2)
-
-        # Create empty scenes file
-        scenes_path = os.path.join(project_path, 'scenes.json')
-        with open(scenes_path, 'w', encoding='utf-8') as f:
-            json.dump({}, f, ensure_ascii=False, indent=2)
-
         # Split story into chapters using LLMService
         llm_service = LLMService()
         chapters = await llm_service.split_story_into_chapters(story_content)
 
         # Create chapter directories and content.txt files
         # chapter_file_service = ChapterFileService()
-        chapter_names = []
-        for i, chapter_content in enumerate(chapters, 1):
-            chapter_name = f'chapter{i}'
-            chapter_path = os.path.join(project_path, chapter_name)
-            os.makedirs(chapter_path, exist_ok=True)
-            content_file = os.path.join(chapter_path, 'content.txt')
-            with open(content_file, 'w', encoding='utf-8') as f:
-                f.write(chapter_content)
-            chapter_names.append(chapter_name)
+        chapter_names = [f'chapter{i}' for i in range(1, len(chapters) + 1)]
+        await asyncio.gather(*(
+            asyncio.to_thread(_write_chapter, project_path, chapter_name, chapter_content)
+            for chapter_name, chapter_content in zip(chapter_names, chapters)))
 
         return make_response(
             data={
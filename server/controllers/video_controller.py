@@ -1,12 +1,11 @@
 import asyncio
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import FileResponse
 from typing import Optional, Tuple, Dict
 import os
-from pathlib import Path
 from pydantic import BaseModel
 from concurrent.futures import ThreadPoolExecutor
-from server.config.config import load_config
+from server.config.config import get_projects_path
 from server.services.video_service import VideoService
 from server.utils.response import make_response, APIException
 import logging
@@ -32,12 +31,11 @@ class VideoSettings(BaseModel):
 
 
 @router.post("/generate_video")
-async def generate_video(settings: Optional[VideoSettings] = None):
+async def generate_video(settings: Optional[VideoSettings] = None,
+                         projects_path: str = Depends(get_projects_path)):
     try:
-        config = load_config()
-        base_path = config.get('projects_path', 'projects/')
         chapter_path = os.path.join(
-            base_path, settings.project_name, settings.chapter_name)
+            projects_path, settings.project_name, settings.chapter_name)
 
         if not os.path.exists(chapter_path):
             return make_response(status='error', msg='chapter does not exist')
@@ -59,18 +57,22 @@ async def generate_video(settings: Optional[VideoSettings] = None):
 
 
 @router.get("/get_video")
-async def get_video(project_name: str, chapter_name: str):
+async def get_video(project_name: str, chapter_name: str,
+                    projects_path: str = Depends(get_projects_path)):
     """API to get video file"""
     try:
-        config = load_config()
-        video_path = Path(config['projects_path']) / \
-            project_name / chapter_name / "video.mp4"
+        video_path = os.path.join(
+            projects_path, project_name, chapter_name, "video.mp4")
 
-        if not video_path.exists():
+        # Single stat; FileResponse reuses it instead of stat-ing the file again
+        try:
+            stat_result = await asyncio.to_thread(os.stat, video_path)
+        except (FileNotFoundError, NotADirectoryError):
             return make_response(status='error', msg='Video does not exist')
 
         return FileResponse(
             video_path,
+            stat_result=stat_result,
             media_type="video/mp4",
             filename=f"{chapter_name}_video.mp4"
         )
@@ -4,7 +4,6 @@ from typing import Dict, List
 from datetime import datetime
 import signal
 import edge_tts
-import traceback
 from .base_service import SingletonService
 import logging
 
@@ -93,8 +92,7 @@ class AudioService(SingletonService):
 
             except Exception as e:
                 error_msg = f"Error generating audio at index {i}: {str(e)}"
-                print(error_msg)
-                traceback.print_exc()
+                logger.exception(error_msg)
                 task['errors'].append(error_msg)
                 if os.path.exists(output_path):
                     os.remove(output_path)
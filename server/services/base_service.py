@@ -1,5 +1,5 @@
 from abc import ABC
-from server.config.config import load_config
+from server.config.config import current_config
 import logging
 
 # Configure logging
@@ -18,15 +18,16 @@ class SingletonService(ABC):
     Singleton service base class for services requiring singleton pattern
     """
     _instances = {}
-    _config = None
 
     @classmethod
     def get_config(cls):
-        """Load global configuration"""
-        if cls._config is None:
-            cls._config = load_config()
-            logger.info("Configuration loaded successfully")
-        return cls._config
+        """Latest global configuration snapshot"""
+        return current_config()
+
+    @property
+    def config(self):
+        # Resolved on access so services follow config updates
+        return current_config()
 
     def __new__(cls, *args, **kwargs):
         if cls not in cls._instances:
@@ -42,7 +43,6 @@ class SingletonService(ABC):
         # Ensure initialization runs only once
         if not self._initialized:
             logger.info(f"{self.__class__.__name__}: Starting initialization")
-            self.config = self.get_config()
             self._initialize(*args, **kwargs)
             self._initialized = True
             logger.info(f"{self.__class__.__name__}: Initialization completed")
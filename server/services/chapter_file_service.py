@@ -1,6 +1,6 @@
 import os
-import json
-from server.config.config import load_config
+from server.utils.file_io import read_text, write_json
+from server.utils.fastrm import fast_rmtree
 from typing import Dict, List
 from .base_service import SingletonService
 import logging
@@ -9,8 +9,7 @@ logger = logging.getLogger(__name__)
 
 
 class ChapterFileService(SingletonService):
-    def __init__(self):
-        self.config = load_config()
+    def _initialize(self):
         self.projects_path = self.config.get('projects_path', 'projects/')
 
     def get_chapter_content(self, project_name: str, chapter_name: str) -> str:
@@ -27,10 +26,8 @@ class ChapterFileService(SingletonService):
         try:
             chapter_path = os.path.join(
                 self.projects_path, project_name, chapter_name)
-            content_path = os.path.join(chapter_path, 'content.txt')
-            if os.path.exists(content_path):
-                with open(content_path, 'r', encoding='utf-8') as f:
-                    return f.read()
+            return read_text(os.path.join(chapter_path, 'content.txt'))
+        except FileNotFoundError:
             return ''
         except Exception as e:
             logger.error(f"Error reading chapter content: {e}")
@@ -38,16 +35,16 @@ class ChapterFileService(SingletonService):
 
     def get_latest_chapter(self, project_path: str) -> int:
         """Get the latest chapter number"""
-        if not os.path.exists(project_path):
+        try:
+            with os.scandir(project_path) as it:
+                chapters = [e.name for e in it
+                            if e.name.startswith("chapter") and e.is_dir()]
+        except FileNotFoundError:
             raise Exception(f"Project path does not exist: {project_path}")
-
-        chapters = [d for d in os.listdir(project_path)
-                    if os.path.isdir(os.path.join(project_path, d))
-                    and d.startswith("chapter")]
         if not chapters:
             return 1
 
-        latest = max(int(ch.replace("chapter", "")) for ch in chapters)
+        latest = max(int(ch[7:]) for ch in chapters)  # strip "chapter" prefix
         return latest
 
     def generate_span_files(self, project_name: str, chapter_name: str, spans_and_prompts: List[dict]) -> None:
@@ -66,19 +63,18 @@ class ChapterFileService(SingletonService):
             # Build chapter directory path
             chapter_dir = os.path.join(
                 self.projects_path, project_name,  chapter_name)
-            print(f"Chapter directory: {chapter_dir}")
-            # If chapter directory does not exist, raise an error
-            if not os.path.exists(chapter_dir):
+            logger.debug("Chapter directory: %s", chapter_dir)
+            # Clear existing subfolders; a missing chapter directory is reported by scandir
+            try:
+                with os.scandir(chapter_dir) as it:
+                    # Only delete folders with numeric names
+                    span_dirs = [e.path for e in it
+                                 if e.name.isdigit() and e.is_dir(follow_symlinks=False)]
+            except FileNotFoundError:
                 raise Exception(
                     f"Chapter directory does not exist: {chapter_dir}")
-
-            # Clear existing subfolders
-            for item in os.listdir(chapter_dir):
-                item_path = os.path.join(chapter_dir, item)
-                # Only delete folders with numeric names
-                if os.path.isdir(item_path) and item.isdigit():
-                    import shutil
-                    shutil.rmtree(item_path)
+            # Span folders hold the generated images and audio; clear them all in one parallel pass
+            fast_rmtree(*span_dirs)
 
             # Create files for each span
             for i, span in enumerate(spans_and_prompts):
@@ -95,8 +91,7 @@ class ChapterFileService(SingletonService):
                     'scene': span['scene'],
                     'prompt': ''  # Default is empty
                 }
-                with open(os.path.join(span_dir, 'prompt.json'), 'w', encoding='utf-8') as f:
-                    json.dump(prompt_data, f, ensure_ascii=False, indent=2)
+                write_json(os.path.join(span_dir, 'prompt.json'), prompt_data)
 
             logging.info(
                 f"Generated {len(spans_and_prompts)} scene files for chapter {chapter_name}")
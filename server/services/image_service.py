@@ -53,10 +53,10 @@ class ImageService(SingletonService):
                 data = json.loads(message)
                 self._ws_messages.append(data)
             except Exception as e:
-                print(f"Error processing WebSocket message: {str(e)}")
+                logger.warning("Error processing WebSocket message: %s", e)
 
         def on_error(ws, error):
-            print(f"WebSocket error: {error}")
+            logger.error("WebSocket error: %s", error)
             self._ws_error = error
 
         def on_close(ws, close_status_code, close_msg):
@@ -132,11 +132,11 @@ class ImageService(SingletonService):
                                 if history and prompt_id in history:
                                     return True, history[prompt_id]
                         except Exception as e:
-                            print(f"Failed to get history: {str(e)}")
+                            logger.warning("Failed to get history: %s", e)
                         return False, None
             time.sleep(0.1)
 
-        print(f"Execution timeout: {prompt_id}")
+        logger.warning("Execution timeout: %s", prompt_id)
         return False, None
 
     def generate_images(
@@ -174,6 +174,10 @@ class ImageService(SingletonService):
         }
 
         if not workflow_error:
+            # Resolved once per batch rather than per prompt
+            reference_image_mode = self.config['comfyui'].get(
+                'reference_image_mode', True)
+
             def generate_worker():
                 try:
                     for i, (prompt, output_dir) in enumerate(zip(prompts, output_dirs)):
@@ -196,7 +200,7 @@ class ImageService(SingletonService):
                             current_workflow, current_params['seed'])
                         current_workflow = self.workflow_service.update_workflow_params(
                             current_workflow, current_params)
-                        if self.config['comfyui'].get('reference_image_mode', True) and current_params.get('reference_image_paths'):
+                        if reference_image_mode and current_params.get('reference_image_paths'):
                             ref_paths = current_params.get(
                                 'reference_image_paths')
                             if i < len(ref_paths):
@@ -280,7 +284,7 @@ class ImageService(SingletonService):
                 os.makedirs(os.path.dirname(output_path), exist_ok=True)
                 with open(output_path, 'wb') as f:
                     f.write(image_response.content)
-                print(f"Saved generated image to {output_path}")
+                logger.debug("Saved generated image to %s", output_path)
             else:
                 raise Exception(
                     f"Failed to download image: {image_response.status_code}")
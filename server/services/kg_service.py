@@ -1,74 +1,238 @@
 import logging
 import os
-import json
+import orjson
 import asyncio
-from server.config.config import load_config
-from typing import Dict, List, Optional, Any, Tuple, Callable
-from collections import deque
+import functools
+import threading
+from typing import Dict, List, Optional, Any, Tuple, Callable, Union, TypedDict
+from collections import defaultdict
 from .base_service import SingletonService
+from server.utils.file_io import read_bytes, read_json, JSON_WRITE_OPTIONS
 from langchain_core.tools import tool, StructuredTool
 
+try:
+    import msgpack
+except ImportError:  # Optional: only needed for the kg_msgpack_sidecar setting
+    msgpack = None
+
 logger = logging.getLogger(__name__)
 
+# Quiet period after the last change before a scheduled KG save is written
+SAVE_DEBOUNCE_SECONDS = 0.5
+# Mutators a journal line may name
+JOURNAL_OPS = frozenset({
+    'new_entity', 'modify_entity', 'delete_entity', 'new_relationship',
+    'modify_relationship', 'delete_relationship', 'set_entity_lock'})
+# Key in kg.json holding the sequence number of the last journal line the file contains
+JOURNAL_SEQ_KEY = 'journal_seq'
+# Operations batch_operations may run: mutators get save_kg=False, queries run as they are
+BATCH_MUTATORS = frozenset({
+    'new_entity', 'modify_entity', 'delete_entity', 'new_relationship',
+    'modify_relationship', 'delete_relationship'})
+BATCH_QUERIES = frozenset({
+    'inquire_entities', 'inquire_relationship', 'inquire_entity_relationships',
+    'inquire_entity_names', 'inquire_entity_list'})
+
+
+def _journaled(method: Callable) -> Callable:
+    """
+    Run a mutator under its project's lock
+
+    The change and its journal line then happen as one step relative to save_kg's
+    snapshot, so the journal sequence stored in kg.json is exact.
+    """
+    @functools.wraps(method)
+    def wrapper(self, project_name: str, *args, **kwargs):
+        with self._project_lock(project_name):
+            return method(self, project_name, *args, **kwargs)
+    return wrapper
+
+
+@functools.lru_cache(maxsize=1024)
+def _project_file(projects_path: str, project_name: str, filename: str) -> str:
+    """Joined once per file; keyed on projects_path so a config change picks up new paths"""
+    return os.path.join(projects_path, project_name, filename)
+
+
+def _write_atomic(path: str, payload: bytes) -> None:
+    """Write through a fsynced temp file so readers see the old or the new file, never a partial one"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _to_json(obj) -> str:
+    """JSON text for tool results; orjson output is UTF-8 like ensure_ascii=False"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def _tool_result(result) -> str:
+    """Serialize a service result for a tool reply; message strings pass through as they are"""
+    return result if isinstance(result, str) else _to_json(result)
+
+
+class DeleteResult(TypedDict):
+    ok: bool
+    msg: str
+
+
+class _KGIndex:
+    """
+    Lookup tables over a cached graph's entity and relationship lists
+
+    The lists stay the source of truth (they are what gets saved); the tables hold
+    the same dict objects, keeping the first occurrence like a linear scan would.
+    """
+    __slots__ = ('entities', 'relationships', 'by_entity', 'graph', 'locked')
+
+    def __init__(self, kg_data: dict):
+        self.entities: Dict[str, dict] = {}
+        for entity in kg_data['entities']:
+            self.entities.setdefault(entity['name'], entity)
+        # (type, source, target) -> relationship
+        self.relationships: Dict[Tuple[str, str, str], dict] = {}
+        # Entity name -> relationships it takes part in, in list order
+        self.by_entity: Dict[str, List[dict]] = defaultdict(list)
+        self.locked = set(kg_data['locked_entities'])
+        # Adjacency for path queries, built by KGService._build_graph on first use
+        self.graph: Optional[dict] = None
+        for rel in kg_data['relationships']:
+            self.add_relationship(rel)
+
+    def add_relationship(self, rel: dict) -> None:
+        self.relationships.setdefault(
+            (rel['type'], rel['source'], rel['target']), rel)
+        self.by_entity[rel['source']].append(rel)
+        if rel['target'] != rel['source']:
+            self.by_entity[rel['target']].append(rel)
+        if self.graph is not None:
+            # Same entries _build_graph produces for this relationship
+            source, target = rel['source'], rel['target']
+            self.graph.setdefault(source, []).append((target, rel))
+            self.graph.setdefault(target, []).append((source, rel))
+
+    def remove_entity(self, name: str) -> List[dict]:
+        """Drop an entity and its relationships from the tables; returns the removed relationships"""
+        self.entities.pop(name, None)
+        removed = self.by_entity.pop(name, None) or []
+        if self.graph is not None:
+            self.graph.pop(name, None)
+        self.remove_relationships(removed)
+        return removed
+
+    def remove_relationships(self, rels: List[dict]) -> None:
+        """Drop relationships from the tables, touching only their endpoints' entries"""
+        if not rels:
+            return
+        removed_ids = {id(rel) for rel in rels}
+        endpoints = set()
+        for rel in rels:
+            key = (rel['type'], rel['source'], rel['target'])
+            if self.relationships.get(key) is rel:
+                del self.relationships[key]
+            endpoints.add(rel['source'])
+            endpoints.add(rel['target'])
+        for endpoint in endpoints:
+            if endpoint in self.by_entity:
+                self.by_entity[endpoint] = [
+                    rel for rel in self.by_entity[endpoint] if id(rel) not in removed_ids]
+            if self.graph is not None and endpoint in self.graph:
+                self.graph[endpoint] = [
+                    edge for edge in self.graph[endpoint] if id(edge[1]) not in removed_ids]
+
+
+def _discard_items(items: list, doomed: List[dict]) -> None:
+    """Remove the given objects from items in place, so lists handed out earlier stay current"""
+    if len(doomed) == 1:
+        target = doomed[0]
+        for i, item in enumerate(items):
+            if item is target:
+                del items[i]
+                return
+        return
+    doomed_ids = {id(item) for item in doomed}
+    items[:] = [item for item in items if id(item) not in doomed_ids]
+
 
 class KGService(SingletonService):
     def _initialize(self):
         self.kg_cache = {}  # Cache for loaded knowledge graphs
+        self.kg_index = {}  # _KGIndex per cached graph, built lazily on first use
         self.kg_dirty = {}  # Tracks modified cache
-        self.config = load_config()
-        self.tools = []
-        self._register_tools()
-
-    def _register_tools(self):
+        self._save_timers = {}  # Pending debounced saves per project
+        self._save_timers_lock = threading.Lock()
+        self._project_locks = {}  # Serializes mutations and kg.json writes per project
+        self._journal_lock = threading.Lock()
+        self._journal_sizes = {}  # Bytes appended to each project's journal since its last compaction
+        self._journal_seqs = {}  # Sequence number of each project's last journal line
+        self._replaying = set()  # Projects whose journal is being replayed (not re-journaled)
+
+    @functools.cached_property
+    def tools(self) -> List[StructuredTool]:
+        """Agent tools, built on first use; the service is a singleton, so only once per process"""
         def inquire_entities(project_name: str, names: List[str]) -> str:
             """Query entity information for single or multiple entities"""
             try:
-                result = self.inquire_entities(project_name, names)
-                return result
+                return _tool_result(self.inquire_entities(project_name, names))
             except Exception as e:
                 logger.error(
                     f"KGService.mcp_tool.inquire_entities: Error: {str(e)}", exc_info=True)
-                return json.dumps({"error": f"Error in inquire_entities: {str(e)}"})
+                return _to_json({"error": f"Error in inquire_entities: {str(e)}"})
 
         def new_entity(project_name: str, name: str, attributes: Optional[dict] = None) -> str:
             """Add a new entity"""
             try:
-                result = self.new_entity(project_name, name, attributes)
+                result = self.new_entity(
+                    project_name, name, attributes, save_kg=False)
+                self.schedule_save(project_name)
                 logger.info(
                     f"KGService.mcp_tool.new_entity: Returned: {result}")
                 return result
             except Exception as e:
                 logger.error(
                     f"KGService.mcp_tool.new_entity: Error: {str(e)}", exc_info=True)
-                return json.dumps({"error": f"Error in new_entity: {str(e)}"})
+                return _to_json({"error": f"Error in new_entity: {str(e)}"})
 
         def modify_entity(project_name: str, name: str, attributes: Optional[dict] = None) -> str:
             """Modify an entity"""
-            return self.modify_entity(project_name, name, attributes)
+            result = self.modify_entity(project_name, name, attributes, save_kg=False)
+            self.schedule_save(project_name)
+            return result
 
         def delete_entity(project_name: str, name: str) -> str:
             """Delete an entity"""
-            return self.delete_entity(project_name, name)
+            result = self.delete_entity(project_name, name, save_kg=False)['msg']
+            self.schedule_save(project_name)
+            return result
 
         def inquire_relationship(project_name: str, entity_a: str, entity_b: str) -> str:
             """Query relationship between two entities"""
-            return self.inquire_relationship(project_name, entity_a, entity_b)
+            return _tool_result(self.inquire_relationship(project_name, entity_a, entity_b))
 
         def new_relationship(project_name: str, type: str, source: str, target: str, attributes: Optional[dict] = None) -> str:
             """Add a new relationship"""
-            return self.new_relationship(project_name, type, source, target, attributes)
+            result = self.new_relationship(project_name, type, source, target, attributes, save_kg=False)
+            self.schedule_save(project_name)
+            return result
 
         def modify_relationship(project_name: str, type: str, source: str, target: str, attributes: Optional[dict] = None) -> str:
             """Modify a relationship"""
-            return self.modify_relationship(project_name, type, source, target, attributes)
+            result = self.modify_relationship(project_name, type, source, target, attributes, save_kg=False)
+            self.schedule_save(project_name)
+            return result
 
         def delete_relationship(project_name: str, type: str, source: str, target: str) -> str:
             """Delete a relationship"""
-            return self.delete_relationship(project_name, type, source, target)
+            result = self.delete_relationship(project_name, type, source, target, save_kg=False)
+            self.schedule_save(project_name)
+            return result
 
         def inquire_entity_relationships(project_name: str, name: str) -> str:
             """Query all relationships of an entity"""
-            return self.inquire_entity_relationships(project_name, name)
+            return _tool_result(self.inquire_entity_relationships(project_name, name))
 
         def inquire_entity_names(project_name: str) -> str:
             """Get list of all entity names"""
@@ -78,15 +242,15 @@ class KGService(SingletonService):
                 result_list = self.inquire_entity_names(project_name)
                 logger.info(
                     f"KGService.mcp_tool.inquire_entity_names: Returned: {result_list}")
-                return json.dumps(result_list)
+                return _to_json(result_list)
             except Exception as e:
                 logger.error(
                     f"KGService.mcp_tool.inquire_entity_names: Error: {str(e)}", exc_info=True)
-                return json.dumps({"error": f"Error in inquire_entity_names: {str(e)}", "names": []})
+                return _to_json({"error": f"Error in inquire_entity_names: {str(e)}", "names": []})
 
         def inquire_entity_list(project_name: str) -> str:
             """Get list of all entities with full information"""
-            return self.inquire_entity_list(project_name)
+            return _tool_result(self.inquire_entity_list(project_name))
 
         def get_locked_project_entities(project_name: str) -> str:
             """Get list of locked entities in a project"""
@@ -96,13 +260,24 @@ class KGService(SingletonService):
                 result_list = self.get_locked_entities(project_name)
                 logger.info(
                     f"KGService.mcp_tool.get_locked_project_entities: Returned: {result_list}")
-                return json.dumps(result_list)
+                return _to_json(result_list)
             except Exception as e:
                 logger.error(
                     f"KGService.mcp_tool.get_locked_project_entities: Error: {str(e)}", exc_info=True)
-                return json.dumps({"error": f"Error in get_locked_project_entities: {str(e)}", "locked_entities": []})
+                return _to_json({"error": f"Error in get_locked_project_entities: {str(e)}", "locked_entities": []})
+
+        def batch_operations(project_name: str, ops: List[dict]) -> str:
+            """Run several knowledge graph operations in one call; each op is {"tool": name, "args": {...}} without project_name"""
+            try:
+                results = self.batch(project_name, ops, save_kg=False)
+                self.schedule_save(project_name)
+                return _to_json(results)
+            except Exception as e:
+                logger.error(
+                    f"KGService.mcp_tool.batch_operations: Error: {str(e)}", exc_info=True)
+                return _to_json({"error": f"Error in batch_operations: {str(e)}"})
 
-        self.tools = [
+        return [
             StructuredTool.from_function(func=inquire_entities),
             StructuredTool.from_function(func=new_entity),
             StructuredTool.from_function(func=modify_entity),
@@ -114,11 +289,133 @@ class KGService(SingletonService):
             StructuredTool.from_function(func=inquire_entity_relationships),
             StructuredTool.from_function(func=inquire_entity_names),
             StructuredTool.from_function(func=inquire_entity_list),
-            StructuredTool.from_function(func=get_locked_project_entities)
+            StructuredTool.from_function(func=get_locked_project_entities),
+            StructuredTool.from_function(func=batch_operations)
         ]
 
     def _get_kg_path(self, project_name: str) -> str:
-        return os.path.join(self.config['projects_path'], project_name, 'kg.json')
+        return _project_file(self.config['projects_path'], project_name, 'kg.json')
+
+    def _get_journal_path(self, project_name: str) -> str:
+        return _project_file(self.config['projects_path'], project_name, 'kg.journal.jsonl')
+
+    def _record(self, project_name: str, op: str, *args) -> None:
+        """
+        Mark the cached graph dirty and append the change to the project's journal
+
+        A debounced save_kg can be half a second behind the cache; the journal line
+        (one small append instead of a full kg.json rewrite) lets _load_kg replay
+        changes that never reached kg.json. op is the name of the mutator to call
+        on replay, args its positional arguments after project_name; each line is
+        prefixed with a sequence number so replay can skip what kg.json already holds.
+        """
+        self.kg_dirty[project_name] = True
+        if project_name in self._replaying:
+            return
+        seq = self._journal_seqs[project_name] = self._journal_seqs.get(project_name, 0) + 1
+        line = orjson.dumps([seq, op, *args], option=orjson.OPT_NON_STR_KEYS) + b'\n'
+        try:
+            with self._journal_lock:
+                # Opened per append so no handle keeps the project directory busy
+                with open(self._get_journal_path(project_name), 'ab') as f:
+                    f.write(line)
+                    self._journal_sizes[project_name] = f.tell()
+        except OSError as e:
+            # The change is still in the cache and reaches kg.json with the next save
+            logger.warning(f"Could not journal {op} for {project_name}: {str(e)}")
+
+    def _project_lock(self, project_name: str) -> threading.RLock:
+        """Per-project lock; re-entrant because mutators call save_kg and each other"""
+        lock = self._project_locks.get(project_name)
+        if lock is None:
+            with self._save_timers_lock:
+                lock = self._project_locks.setdefault(project_name, threading.RLock())
+        return lock
+
+    def _replay_journal(self, project_name: str, saved_seq: int) -> None:
+        """
+        Re-apply journaled changes on top of the just-loaded kg.json
+
+        Args:
+            project_name (str): Project ID
+            saved_seq (int): Sequence number of the last journal line kg.json contains
+        """
+        self._journal_seqs[project_name] = saved_seq
+        journal_path = self._get_journal_path(project_name)
+        try:
+            data = read_bytes(journal_path)
+        except FileNotFoundError:
+            self._journal_sizes[project_name] = 0
+            return
+        self._journal_sizes[project_name] = len(data)
+        if not data:
+            return
+
+        # Ops are not idempotent (modify_relationship re-types the first source/target match),
+        # so only lines newer than kg.json are applied
+        replayed = 0
+        self._replaying.add(project_name)
+        try:
+            for line in data.splitlines():
+                try:
+                    seq, op, *args = orjson.loads(line)
+                    if not isinstance(seq, int) or op not in JOURNAL_OPS:
+                        raise ValueError(op)
+                except (orjson.JSONDecodeError, ValueError, TypeError):
+                    # A torn final line from an interrupted append
+                    logger.warning(f"Stopping journal replay for {project_name} at an unreadable line")
+                    break
+                if seq <= saved_seq:
+                    continue
+                self._journal_seqs[project_name] = seq
+                try:
+                    getattr(self, op)(project_name, *args, save_kg=False)
+                    replayed += 1
+                except Exception as e:
+                    logger.warning(f"Skipping journaled {op} for {project_name}: {str(e)}")
+        finally:
+            self._replaying.discard(project_name)
+        if replayed:
+            logger.info(f"Replayed {replayed} journaled knowledge graph changes for {project_name}")
+            self.kg_dirty[project_name] = True
+
+    def _compact_journal(self, project_name: str, covered: int) -> None:
+        """Drop the journal prefix a finished kg.json write now contains"""
+        journal_path = self._get_journal_path(project_name)
+        with self._journal_lock:
+            try:
+                if self._journal_sizes.get(project_name, 0) <= covered:
+                    os.remove(journal_path)
+                    self._journal_sizes[project_name] = 0
+                    return
+                with open(journal_path, 'rb') as f:
+                    f.seek(covered)
+                    tail = f.read()
+                _write_atomic(journal_path, tail)
+                self._journal_sizes[project_name] = len(tail)
+            except FileNotFoundError:
+                self._journal_sizes[project_name] = 0
+
+    def _msgpack_sidecar_enabled(self) -> bool:
+        """kg.msgpack is written next to kg.json when configured and msgpack is installed"""
+        return msgpack is not None and bool(self.config.get('kg_msgpack_sidecar', False))
+
+    def _read_kg_file(self, kg_path: str) -> Any:
+        """
+        Parse the saved knowledge graph
+
+        kg.json stays the source of truth (routes and clients read it); the binary
+        kg.msgpack sidecar is only used while it is at least as new as kg.json.
+        """
+        if self._msgpack_sidecar_enabled():
+            sidecar_path = kg_path[:-len('.json')] + '.msgpack'
+            try:
+                if os.stat(sidecar_path).st_mtime_ns >= os.stat(kg_path).st_mtime_ns:
+                    return msgpack.unpackb(read_bytes(sidecar_path), raw=False,
+                                           strict_map_key=False)
+            except (OSError, ValueError, msgpack.UnpackException) as e:
+                logger.warning(f"Ignoring knowledge graph sidecar {sidecar_path}: {str(e)}")
+        return read_json(kg_path)
 
     def _load_kg(self, project_name: str) -> dict:
         """
@@ -134,8 +431,9 @@ class KGService(SingletonService):
             ValueError: If knowledge graph file format is invalid
             Exception: For other loading errors
         """
-        if project_name in self.kg_cache:
-            return self.kg_cache[project_name]
+        cached = self.kg_cache.get(project_name)
+        if cached is not None:
+            return cached
 
         kg_path = self._get_kg_path(project_name)
         default_kg = {'entities': [],
@@ -143,37 +441,116 @@ class KGService(SingletonService):
 
         if not os.path.exists(kg_path):
             self.kg_cache[project_name] = default_kg
+            self._replay_journal(project_name, 0)
             return default_kg
 
         try:
-            with open(kg_path, 'r', encoding='utf-8') as f:
-                kg_data = json.load(f)
-
-                if not isinstance(kg_data, dict):
-                    raise ValueError(
-                        'Knowledge graph data must be a dictionary')
-
-                kg_data.setdefault('entities', [])
-                kg_data.setdefault('relationships', [])
-                kg_data.setdefault('locked_entities', [])
-
-                if not isinstance(kg_data['entities'], list):
-                    raise ValueError('Entities must be a list')
-                if not isinstance(kg_data['relationships'], list):
-                    raise ValueError('Relationships must be a list')
-                if not isinstance(kg_data['locked_entities'], list):
-                    raise ValueError('Locked_entities must be a list')
-
-                self.kg_cache[project_name] = kg_data
-                return kg_data
-        except json.JSONDecodeError as e:
+            kg_data = self._read_kg_file(kg_path)
+
+            if not isinstance(kg_data, dict):
+                raise ValueError(
+                    'Knowledge graph data must be a dictionary')
+
+            saved_seq = kg_data.pop(JOURNAL_SEQ_KEY, 0)
+            if not isinstance(saved_seq, int):
+                raise ValueError('Journal sequence must be an integer')
+            kg_data.setdefault('entities', [])
+            kg_data.setdefault('relationships', [])
+            kg_data.setdefault('locked_entities', [])
+
+            if not isinstance(kg_data['entities'], list):
+                raise ValueError('Entities must be a list')
+            if not isinstance(kg_data['relationships'], list):
+                raise ValueError('Relationships must be a list')
+            if not isinstance(kg_data['locked_entities'], list):
+                raise ValueError('Locked_entities must be a list')
+
+            self.kg_cache[project_name] = kg_data
+        except orjson.JSONDecodeError as e:
             raise ValueError(f'Invalid knowledge graph file format: {str(e)}')
         except Exception as e:
             raise Exception(f'Error loading knowledge graph: {str(e)}')
 
+        # Cached first: replaying calls the mutators, which load through this method
+        self._replay_journal(project_name, saved_seq)
+        return kg_data
+
+    def _kg(self, project_name: str) -> dict:
+        """Cached knowledge graph with a single dict lookup; loads it on a miss"""
+        kg_data = self.kg_cache.get(project_name)
+        return kg_data if kg_data is not None else self._load_kg(project_name)
+
+    def _index(self, project_name: str) -> _KGIndex:
+        """Lookup tables for a project's cached graph, loading it if needed"""
+        index = self.kg_index.get(project_name)
+        if index is None:
+            index = self.kg_index[project_name] = _KGIndex(
+                self._kg(project_name))
+        return index
+
+    def schedule_save(self, project_name: str, delay: float = SAVE_DEBOUNCE_SECONDS) -> None:
+        """
+        Save knowledge graph once no further change is scheduled within delay seconds
+
+        Args:
+            project_name (str): Project ID
+            delay (float): Quiet period in seconds before writing
+        """
+        timer = threading.Timer(
+            delay, self._run_scheduled_save, args=(project_name,))
+        with self._save_timers_lock:
+            pending = self._save_timers.get(project_name)
+            if pending:
+                pending.cancel()
+            self._save_timers[project_name] = timer
+        timer.start()
+
+    def _run_scheduled_save(self, project_name: str) -> None:
+        with self._save_timers_lock:
+            # A newer schedule_save may already have replaced this timer
+            if self._save_timers.get(project_name) is threading.current_thread():
+                del self._save_timers[project_name]
+        try:
+            self.save_kg(project_name)
+        except Exception as e:
+            logger.error(f"Scheduled knowledge graph save failed for {project_name}: {str(e)}")
+
+    def flush_pending_saves(self, project_name: Optional[str] = None) -> None:
+        """
+        Write scheduled saves immediately
+
+        Args:
+            project_name (Optional[str]): Project ID, or None for all projects
+        """
+        with self._save_timers_lock:
+            names = list(self._save_timers) if project_name is None else [project_name]
+            pending = [name for name in names if name in self._save_timers]
+            for name in pending:
+                self._save_timers.pop(name).cancel()
+        for name in pending:
+            self.save_kg(name)
+
+    def discard_project(self, project_name: str) -> None:
+        """
+        Forget a deleted or renamed project: cancel its pending save and drop its cached state
+
+        Args:
+            project_name (str): Project ID
+        """
+        with self._save_timers_lock:
+            pending = self._save_timers.pop(project_name, None)
+        if pending:
+            pending.cancel()
+        self.kg_cache.pop(project_name, None)
+        self.kg_index.pop(project_name, None)
+        self.kg_dirty.pop(project_name, None)
+        with self._journal_lock:
+            self._journal_sizes.pop(project_name, None)
+            self._journal_seqs.pop(project_name, None)
+
     def save_kg(self, project_name: str) -> None:
         """
-        Save knowledge graph to file
+        Save knowledge graph to file; a no-op when nothing changed since the last save
 
         Args:
             project_name (str): Project ID
@@ -182,15 +559,79 @@ class KGService(SingletonService):
             raise Exception(
                 f"Knowledge graph for project {project_name} not loaded")
 
+        # This write covers any save still waiting for its debounce delay
+        with self._save_timers_lock:
+            pending = self._save_timers.pop(project_name, None)
+        if pending and pending is not threading.current_thread():
+            pending.cancel()
+
+        if not self.kg_dirty.get(project_name):
+            return
+
         kg_path = self._get_kg_path(project_name)
-        os.makedirs(os.path.dirname(kg_path), exist_ok=True)
-        kg_data = self._load_kg(project_name)
+        if not os.path.isdir(os.path.dirname(kg_path)):
+            # The project was deleted or renamed after the change; recreating its
+            # directory would resurrect it under the old name
+            logger.warning(f"Skipping knowledge graph save, project {project_name} no longer exists")
+            return
+        kg_data = self.kg_cache[project_name]
         try:
-            with open(kg_path, 'w', encoding='utf-8') as f:
-                json.dump(kg_data, f, ensure_ascii=False, indent=2)
+            # Snapshot and write under one lock so an older snapshot never lands after a newer one.
+            # Mutators hold the same lock, so no change sits between the cache and the journal
+            # while the snapshot is taken.
+            with self._project_lock(project_name):
+                # Cleared before the snapshot: a change made after it marks the graph dirty again
+                self.kg_dirty[project_name] = False
+                # Every journal line up to here is contained in the payload
+                covered = self._journal_sizes.get(project_name, 0)
+                saved = {**kg_data, JOURNAL_SEQ_KEY: self._journal_seqs.get(project_name, 0)}
+                payload = orjson.dumps(saved, option=JSON_WRITE_OPTIONS)
+                sidecar = msgpack.packb(saved, use_bin_type=True) \
+                    if self._msgpack_sidecar_enabled() else None
+                _write_atomic(kg_path, payload)
+                if sidecar is not None:
+                    # Written after kg.json so its mtime marks it as current
+                    _write_atomic(kg_path[:-len('.json')] + '.msgpack', sidecar)
+                self._compact_journal(project_name, covered)
         except Exception as e:
+            self.kg_dirty[project_name] = True
             raise Exception(f'Error saving knowledge graph: {str(e)}')
 
+    async def save_kg_async(self, project_name: str) -> None:
+        """
+        Save knowledge graph from a worker thread so the event loop keeps serving requests
+
+        Args:
+            project_name (str): Project ID
+        """
+        await asyncio.to_thread(self.save_kg, project_name)
+
+    def get_knowledge_graph(self, project_name: str) -> Tuple[dict, os.stat_result]:
+        """
+        Cached knowledge graph with the stat of the kg.json it matches, for ETags
+
+        Pending changes are written first, so the stat describes the returned graph.
+
+        Args:
+            project_name (str): Project ID
+
+        Returns:
+            Tuple[dict, os.stat_result]: Knowledge graph data (shared, not a copy) and kg.json stat
+
+        Raises:
+            FileNotFoundError: If the project has no kg.json
+        """
+        with self._project_lock(project_name):
+            kg_path = self._get_kg_path(project_name)
+            # Stat first, so a missing project is not cached as an empty graph
+            kg_st = os.stat(kg_path)
+            kg_data = self._kg(project_name)
+            if self.kg_dirty.get(project_name):
+                # A scheduled save, or journal lines replayed on load
+                self.save_kg(project_name)
+                kg_st = os.stat(kg_path)
+            return kg_data, kg_st
+
     def get_tools(self, include_all: bool = False) -> List[dict]:
         """
         Get list of knowledge graph tools
@@ -203,7 +644,7 @@ class KGService(SingletonService):
         """
         return self.tools
 
-    def inquire_entities(self, project_name: str, names: List[str]) -> str:
+    def inquire_entities(self, project_name: str, names: List[str]) -> Union[List[Dict], str]:
         """
         Query entity information for single or multiple entities
 
@@ -212,22 +653,23 @@ class KGService(SingletonService):
             names (List[str]): List of entity names
 
         Returns:
-            str: JSON string of entity information list.
+            Union[List[Dict], str]: Entity information list.
                  If querying a single entity and not found, returns error string.
                  If querying multiple entities, returns found entities, ignoring not found.
         """
         try:
-            kg_data = self._load_kg(project_name)
-            entities = [entity for entity in kg_data.get(
-                'entities', []) if entity['name'] in names]
+            index = self._index(project_name)
+            entities = [index.entities[name] for name in dict.fromkeys(names)
+                        if name in index.entities]
 
             if len(names) == 1 and not entities:
                 return f"Entity {names[0]} does not exist"
 
-            return json.dumps(entities, ensure_ascii=False)
+            return entities
         except Exception as e:
             raise Exception(f"Failed to query entities: {str(e)}")
 
+    @_journaled
     def new_entity(self, project_name: str, name: str, attributes: Optional[dict] = None, save_kg: bool = True) -> str:
         """
         Add a new entity
@@ -241,20 +683,23 @@ class KGService(SingletonService):
         Returns:
             str: Operation result
         """
-        kg_data = self._load_kg(project_name)
+        kg_data = self._kg(project_name)
+        index = self._index(project_name)
 
-        if any(e['name'] == name for e in kg_data['entities']):
+        if name in index.entities:
             return f"Entity {name} already exists"
 
         entity = {'name': name, 'attributes': attributes or {}}
         kg_data['entities'].append(entity)
-        self.kg_cache[project_name] = kg_data
+        index.entities[name] = entity
+        self._record(project_name, 'new_entity', name, attributes)
 
         if save_kg:
             self.save_kg(project_name)
 
         return "Added successfully"
 
+    @_journaled
     def modify_entity(self, project_name: str, name: str, attributes: Optional[dict] = None, save_kg: bool = True) -> str:
         """
         Modify an entity
@@ -268,19 +713,18 @@ class KGService(SingletonService):
         Returns:
             str: Operation result
         """
-        kg_data = self._load_kg(project_name)
+        entity = self._index(project_name).entities.get(name)
+        if entity is None:
+            return f"Entity {name} does not exist"
 
-        for entity in kg_data['entities']:
-            if entity['name'] == name:
-                entity['attributes'] = attributes or {}
-                self.kg_cache[project_name] = kg_data
-                if save_kg:
-                    self.save_kg(project_name)
-                return "Modified successfully"
-
-        return f"Entity {name} does not exist"
+        entity['attributes'] = attributes or {}
+        self._record(project_name, 'modify_entity', name, attributes)
+        if save_kg:
+            self.save_kg(project_name)
+        return "Modified successfully"
 
-    def delete_entity(self, project_name: str, name: str, save_kg: bool = True) -> str:
+    @_journaled
+    def delete_entity(self, project_name: str, name: str, save_kg: bool = True) -> DeleteResult:
         """
         Delete an entity
 
@@ -290,28 +734,33 @@ class KGService(SingletonService):
             save_kg (bool): Whether to save knowledge graph (default: True)
 
         Returns:
-            str: Operation result
+            DeleteResult: ok flag and operation result message
         """
         try:
-            kg_data = self._load_kg(project_name)
-
-            if name in self.get_locked_entities(project_name):
-                return f"Entity {name} is locked and cannot be deleted"
-
-            kg_data['entities'] = [
-                e for e in kg_data['entities'] if e['name'] != name]
-            kg_data['relationships'] = [r for r in kg_data['relationships']
-                                        if r['source'] != name and r['target'] != name]
-
-            self.kg_cache[project_name] = kg_data
+            kg_data = self._kg(project_name)
+
+            if name in self._index(project_name).locked:
+                return {'ok': False, 'msg': f"Entity {name} is locked and cannot be deleted"}
+
+            index = self._index(project_name)
+            has_entity = name in index.entities
+            removed = index.remove_entity(name)
+            if has_entity:
+                kg_data['entities'][:] = [
+                    e for e in kg_data['entities'] if e['name'] != name]
+            if removed:
+                # The index already knows which relationships go; no per-field comparisons here
+                _discard_items(kg_data['relationships'], removed)
+            if has_entity or removed:
+                self._record(project_name, 'delete_entity', name)
             if save_kg:
                 self.save_kg(project_name)
 
-            return "Deleted successfully"
+            return {'ok': True, 'msg': "Deleted successfully"}
         except Exception as e:
             raise Exception(f"Failed to delete entity: {str(e)}")
 
-    def inquire_relationship(self, project_name: str, entity_a: str, entity_b: str) -> str:
+    def inquire_relationship(self, project_name: str, entity_a: str, entity_b: str) -> Union[List[Dict], str]:
         """
         Query relationship between two entities
 
@@ -321,23 +770,28 @@ class KGService(SingletonService):
             entity_b (str): Second entity name
 
         Returns:
-            str: Relationship information
+            Union[List[Dict], str]: Direct relationships, or a message describing the indirect path
         """
-        kg_data = self._load_kg(project_name)
-        direct = [r for r in kg_data['relationships'] if (r['source'] == entity_a and r['target'] == entity_b) or (
-            r['source'] == entity_b and r['target'] == entity_a)]
+        kg_data = self._kg(project_name)
+        index = self._index(project_name)
+        direct = [r for r in index.by_entity.get(entity_a, ())
+                  if (r['source'] == entity_a and r['target'] == entity_b) or (
+                      r['source'] == entity_b and r['target'] == entity_a)]
 
         if direct:
-            return json.dumps(direct, ensure_ascii=False)
+            return direct
 
-        graph = self._build_graph(kg_data)
-        path = self._find_shortest_path(graph, entity_a, entity_b)
+        # Cached with the index: changes update it in place
+        if index.graph is None:
+            index.graph = self._build_graph(kg_data)
+        path = self._find_shortest_path(index.graph, entity_a, entity_b)
 
         if path:
-            return f"Found indirect relationship path: {json.dumps(path, ensure_ascii=False)}"
+            return f"Found indirect relationship path: {_to_json(path)}"
 
         return "Relationship does not exist"
 
+    @_journaled
     def new_relationship(self, project_name: str, type: str, source: str, target: str, attributes: Optional[dict] = None, save_kg: bool = True) -> str:
         """
         Add a new relationship
@@ -357,14 +811,15 @@ class KGService(SingletonService):
             if not type or not type.strip():
                 return "Relationship type cannot be empty"
 
-            kg_data = self._load_kg(project_name)
+            kg_data = self._kg(project_name)
+            index = self._index(project_name)
 
-            if not any(e['name'] == source for e in kg_data['entities']):
+            if source not in index.entities:
                 return f"Source entity {source} does not exist"
-            if not any(e['name'] == target for e in kg_data['entities']):
+            if target not in index.entities:
                 return f"Target entity {target} does not exist"
 
-            if any(r['type'] == type and r['source'] == source and r['target'] == target for r in kg_data['relationships']):
+            if (type, source, target) in index.relationships:
                 return "Relationship already exists"
 
             relationship = {
@@ -374,7 +829,8 @@ class KGService(SingletonService):
                 'attributes': attributes or {}
             }
             kg_data['relationships'].append(relationship)
-            self.kg_cache[project_name] = kg_data
+            index.add_relationship(relationship)
+            self._record(project_name, 'new_relationship', type, source, target, attributes)
 
             if save_kg:
                 self.save_kg(project_name)
@@ -383,6 +839,7 @@ class KGService(SingletonService):
         except Exception as e:
             return f"Error adding relationship: {str(e)}"
 
+    @_journaled
     def modify_relationship(self, project_name: str, type: str, source: str, target: str, attributes: Optional[dict] = None, save_kg: bool = True) -> str:
         """
         Modify a relationship
@@ -398,19 +855,30 @@ class KGService(SingletonService):
         Returns:
             str: Operation result
         """
-        kg_data = self._load_kg(project_name)
+        index = self._index(project_name)
 
-        for rel in kg_data['relationships']:
+        for rel in index.by_entity.get(source, ()):
             if rel['source'] == source and rel['target'] == target:
+                old_key = (rel['type'], source, target)
                 rel['type'] = type
                 rel['attributes'] = attributes or {}
-                self.kg_cache[project_name] = kg_data
+                if old_key[0] != type:
+                    # Re-key, pointing the old key at any duplicate that still carries it
+                    if index.relationships.get(old_key) is rel:
+                        del index.relationships[old_key]
+                        for other in index.by_entity[source]:
+                            if (other['type'], other['source'], other['target']) == old_key:
+                                index.relationships[old_key] = other
+                                break
+                    index.relationships.setdefault((type, source, target), rel)
+                self._record(project_name, 'modify_relationship', type, source, target, attributes)
                 if save_kg:
                     self.save_kg(project_name)
                 return "Modified successfully"
 
         return "Relationship does not exist"
 
+    @_journaled
     def delete_relationship(self, project_name: str, type: str, source: str, target: str, save_kg: bool = True) -> str:
         """
         Delete a relationship
@@ -425,20 +893,22 @@ class KGService(SingletonService):
         Returns:
             str: Operation result
         """
-        kg_data = self._load_kg(project_name)
-        initial_length = len(kg_data['relationships'])
-        kg_data['relationships'] = [r for r in kg_data['relationships'] if not (
-            r['type'] == type and r['source'] == source and r['target'] == target)]
-
-        if len(kg_data['relationships']) < initial_length:
-            self.kg_cache[project_name] = kg_data
+        kg_data = self._kg(project_name)
+        index = self._index(project_name)
+        if (type, source, target) in index.relationships:
+            # Duplicates of the key go too; all of them sit in the source's list
+            removed = [r for r in index.by_entity[source]
+                       if r['type'] == type and r['source'] == source and r['target'] == target]
+            index.remove_relationships(removed)
+            _discard_items(kg_data['relationships'], removed)
+            self._record(project_name, 'delete_relationship', type, source, target)
             if save_kg:
                 self.save_kg(project_name)
             return "Deleted successfully"
 
         return "Relationship does not exist"
 
-    def inquire_entity_relationships(self, project_name: str, name: str) -> str:
+    def inquire_entity_relationships(self, project_name: str, name: str) -> Union[List[Dict], str]:
         """
         Query all relationships of an entity
 
@@ -447,20 +917,32 @@ class KGService(SingletonService):
             name (str): Entity name
 
         Returns:
-            str: Relationship information
+            Union[List[Dict], str]: Relationship list, or an error string if the entity does not exist
         """
         try:
-            kg_data = self._load_kg(project_name)
+            index = self._index(project_name)
 
-            if not any(e['name'] == name for e in kg_data['entities']):
+            if name not in index.entities:
                 return f"Entity {name} does not exist"
 
-            relationships = [r for r in kg_data['relationships']
-                             if r['source'] == name or r['target'] == name]
-            return json.dumps(relationships, ensure_ascii=False)
+            # A copy: the index keeps appending to its own list
+            return list(index.by_entity.get(name, ()))
         except Exception as e:
             return f"Error querying entity relationships: {str(e)}"
 
+    def inquire_all_relationships(self, project_name: str) -> Dict[str, List[Dict]]:
+        """
+        Query the relationships of every entity at once
+
+        Args:
+            project_name (str): Project ID
+
+        Returns:
+            Dict[str, List[Dict]]: Entity name -> its relationships, as inquire_entity_relationships returns them
+        """
+        index = self._index(project_name)
+        return {name: list(index.by_entity.get(name, ())) for name in index.entities}
+
     def inquire_entity_names(self, project_name: str) -> List[str]:
         """
         Get list of all entity names
@@ -471,10 +953,10 @@ class KGService(SingletonService):
         Returns:
             List[str]: List of entity names
         """
-        kg_data = self._load_kg(project_name)
+        kg_data = self._kg(project_name)
         return [entity['name'] for entity in kg_data.get('entities', [])]
 
-    def inquire_entity_list(self, project_name: str) -> str:
+    def inquire_entity_list(self, project_name: str) -> List[Dict]:
         """
         Get list of all entities with full information
 
@@ -482,15 +964,49 @@ class KGService(SingletonService):
             project_name (str): Project ID
 
         Returns:
-            str: JSON string of entity list with full information
+            List[Dict]: Entity list with full information
         """
         try:
-            kg_data = self._load_kg(project_name)
-            entities = kg_data.get('entities', [])
-            return json.dumps(entities, ensure_ascii=False)
+            kg_data = self._kg(project_name)
+            return kg_data.get('entities', [])
         except Exception as e:
             raise Exception(f"Failed to get entity list: {str(e)}")
 
+    def batch(self, project_name: str, ops: List[dict], save_kg: bool = True) -> List[dict]:
+        """
+        Run several operations against one loaded knowledge graph, saving at most once
+
+        Args:
+            project_name (str): Project ID
+            ops (List[dict]): Operations as {"tool": name, "args": {...}}, applied in order
+            save_kg (bool): Whether to save knowledge graph after the last operation (default: True)
+
+        Returns:
+            List[dict]: One {"tool", "result"} or {"tool", "error"} entry per operation;
+                        a failed operation does not stop the ones after it
+        """
+        self._kg(project_name)
+        results = []
+        for op in ops:
+            name = op.get('tool') if isinstance(op, dict) else None
+            try:
+                if name not in BATCH_MUTATORS and name not in BATCH_QUERIES:
+                    raise ValueError(f"Unsupported operation: {name}")
+                args = dict(op.get('args') or {})
+                args.pop('project_name', None)
+                if name in BATCH_MUTATORS:
+                    args['save_kg'] = False
+                result = getattr(self, name)(project_name, **args)
+                if name == 'delete_entity':
+                    result = result['msg']
+                results.append({'tool': name, 'result': result})
+            except Exception as e:
+                results.append({'tool': name, 'error': str(e)})
+
+        if save_kg:
+            self.save_kg(project_name)
+        return results
+
     def _build_graph(self, kg_data: dict) -> dict:
         """
         Build graph structure
@@ -514,7 +1030,10 @@ class KGService(SingletonService):
 
     def _find_shortest_path(self, graph: dict, start: str, end: str) -> List[dict]:
         """
-        Find shortest path using BFS
+        Find shortest path using bidirectional BFS
+
+        Both ends are searched level by level, always expanding the smaller frontier;
+        parent pointers replace per-node path copies and the path is rebuilt once.
 
         Args:
             graph (dict): Graph structure
@@ -524,23 +1043,51 @@ class KGService(SingletonService):
         Returns:
             List[dict]: Shortest path
         """
-        if start not in graph or end not in graph:
+        if start not in graph or end not in graph or start == end:
             return []
 
-        visited = {start}
-        queue = deque([(start, [])])
-
-        while queue:
-            current, path = queue.popleft()
-            if current == end:
-                return path
-
-            for neighbor, rel in graph[current]:
-                if neighbor not in visited:
-                    visited.add(neighbor)
-                    queue.append((neighbor, path + [rel]))
+        # Per side: node -> (previous node toward that side's root, relationship)
+        parents = ({start: None}, {end: None})
+        depths = ({start: 0}, {end: 0})
+        frontiers = [[start], [end]]
+
+        while frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            own, other = parents[side], parents[1 - side]
+            own_depth, other_depth = depths[side], depths[1 - side]
+            meeting = None
+            next_frontier = []
+            for current in frontiers[side]:
+                for neighbor, rel in graph[current]:
+                    if neighbor in own:
+                        continue
+                    own[neighbor] = (current, rel)
+                    own_depth[neighbor] = own_depth[current] + 1
+                    next_frontier.append(neighbor)
+                    # Finish the level and keep the meeting closest to the other root
+                    if neighbor in other and (
+                            meeting is None or other_depth[neighbor] < other_depth[meeting]):
+                        meeting = neighbor
+            if meeting is not None:
+                return self._join_paths(parents, meeting)
+            frontiers[side] = next_frontier
         return []
 
+    def _join_paths(self, parents: tuple, meeting: str) -> List[dict]:
+        """Relationships from start to end through the node where both searches met"""
+        forward, backward = parents
+        path = []
+        node = meeting
+        while forward[node] is not None:
+            node, rel = forward[node]
+            path.append(rel)
+        path.reverse()
+        node = meeting
+        while backward[node] is not None:
+            node, rel = backward[node]
+            path.append(rel)
+        return path
+
     def get_locked_entities(self, project_name: str) -> List[str]:
         """
         Get list of locked entities in a project
@@ -551,9 +1098,10 @@ class KGService(SingletonService):
         Returns:
             List[str]: List of locked entity names
         """
-        kg_data = self._load_kg(project_name)
+        kg_data = self._kg(project_name)
         return kg_data.get('locked_entities', [])
 
+    @_journaled
     def toggle_entity_lock(self, project_name: str, entity_name: str, save_kg: bool = False) -> bool:
         """
         Toggle entity lock status
@@ -567,27 +1115,44 @@ class KGService(SingletonService):
             bool: True if now locked, False if now unlocked
         """
         try:
-            entities = self.inquire_entity_list(project_name)
-            entities = json.loads(entities) if isinstance(
-                entities, str) else entities
-            if not any(entity['name'] == entity_name for entity in entities):
+            index = self._index(project_name)
+            if entity_name not in index.entities:
                 raise Exception(f"Entity {entity_name} does not exist")
 
-            kg_data = self._load_kg(project_name)
-            locked_entities = kg_data.get('locked_entities', [])
+            kg_data = self._kg(project_name)
 
-            is_locked = False
-            if entity_name in locked_entities:
-                locked_entities.remove(entity_name)
+            is_locked = entity_name not in index.locked
+            if is_locked:
+                kg_data['locked_entities'].append(entity_name)
+                index.locked.add(entity_name)
             else:
-                locked_entities.append(entity_name)
-                is_locked = True
+                # Drop every occurrence so the list and the set agree
+                kg_data['locked_entities'] = [
+                    n for n in kg_data['locked_entities'] if n != entity_name]
+                index.locked.discard(entity_name)
 
-            kg_data['locked_entities'] = locked_entities
-            self.kg_cache[project_name] = kg_data
+            self._record(project_name, 'set_entity_lock', entity_name, is_locked)
             if save_kg:
                 self.save_kg(project_name)
 
             return is_locked
         except Exception as e:
             raise Exception(f"Failed to toggle entity lock status: {str(e)}")
+
+    @_journaled
+    def set_entity_lock(self, project_name: str, entity_name: str, locked: bool, save_kg: bool = False) -> bool:
+        """
+        Set entity lock status; the idempotent form of toggle_entity_lock used by the journal
+
+        Args:
+            project_name (str): Project name
+            entity_name (str): Entity name
+            locked (bool): Desired lock status
+            save_kg (bool): Whether to save knowledge graph (default: False)
+
+        Returns:
+            bool: True if locked, False if unlocked
+        """
+        if (entity_name in self._index(project_name).locked) != locked:
+            return self.toggle_entity_lock(project_name, entity_name, save_kg=save_kg)
+        return locked
@@ -3,6 +3,7 @@ from server.services.schemas import (
     SceneExtractionResult,
     TextDescResult,
     PromptKontextList,
+    PromptKontextAnswerList,
     PromptList,
     append_output_schema_to_prompt,
     CharacterExtractionSummary,
@@ -10,18 +11,17 @@ from server.services.schemas import (
 from typing import Type
 from pydantic import BaseModel, ValidationError
 import os
-import json
 import logging
 import re
 import asyncio
-from typing import AsyncGenerator, List, Dict
+import functools
+from typing import AsyncGenerator, List, Dict, Tuple
 import google.generativeai as genai
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain.agents import initialize_agent, AgentType
 from langchain.tools import Tool
 from langchain_openai import ChatOpenAI
-from langchain.callbacks import AsyncIteratorCallbackHandler
 
 from server.services.base_service import SingletonService
 from server.services.kg_service import KGService
@@ -29,6 +29,31 @@ from server.services.scene_service import SceneService
 
 logger = logging.getLogger(__name__)
 
+# Streamed tokens joined into one yield by _process_text_stream
+STREAM_COALESCE_TOKENS = 4
+
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[。！？])\s*')
+# {entity} markers in scene prompts
+ENTITY_RE = re.compile(r'\{([^}]+)\}')
+# $$scene$$ markers (plain translation) and [scene] markers (reference image mode)
+SCENE_DOLLAR_RE = re.compile(r'\$\$([^$]+)\$\$')
+SCENE_BRACKET_RE = re.compile(r'\[([^$]+)\]')
+
+
+@functools.lru_cache(maxsize=64)
+def _placeholder_pattern(placeholders: Tuple[str, ...]) -> re.Pattern:
+    # Longest first, so a placeholder that prefixes another never shadows it
+    return re.compile('|'.join(re.escape(p) for p in sorted(placeholders, key=len, reverse=True)))
+
+
+def _fill_placeholders(template: str, replacements: Dict[str, str]) -> str:
+    """Substitute every placeholder in one scan; inserted values are never rescanned"""
+    if not replacements:
+        return template
+    return _placeholder_pattern(tuple(replacements)).sub(
+        lambda m: replacements[m.group(0)], template)
+
+
 # Pydantic and structured model
 
 
@@ -44,18 +69,29 @@ class LLMService(SingletonService):
 
         self.prompts_dir = os.path.join(
             os.path.dirname(os.path.dirname(__file__)), 'prompts')
+        # Templates are read here, so requests on the event loop never open them
+        self._preload_prompts()
         self.projects_path = self.config.get('projects_path', 'projects/')
         self.kg_service = KGService()
         self.scene_service = SceneService()
         # Parse retries: allow override in config.llm.parse_retries, default 2
         self.parse_retries = int(self.config.get(
             'llm', {}).get('parse_retries', 2) or 2)
-
+        # Structured LLM calls in flight at once: config.llm.max_concurrent, default 8
+        self._llm_slots = asyncio.Semaphore(int(self.config.get(
+            'llm', {}).get('max_concurrent', 8) or 8))
+
+        # All calls share this one client; config.llm.transport ('grpc', 'grpc_asyncio' or 'rest')
+        # picks how it talks to the API, the library default when unset
+        transport_kwargs = {}
+        if self.config['llm'].get('transport'):
+            transport_kwargs['transport'] = self.config['llm']['transport']
         self.llm = ChatGoogleGenerativeAI(
             model=self.model_name,  # e.g., "gemini-1.5-pro"
             google_api_key=self.api_key,
             temperature=0.5,
             max_output_tokens=2048,  # Equivalent to max_output_tokens in genai
+            **transport_kwargs,
         )
 
         self.agent = initialize_agent(
@@ -66,6 +102,8 @@ class LLMService(SingletonService):
             handle_parsing_errors=True,
 
         )
+        # Tool agents by the identity of their tools; executors keep no per-run state
+        self._tool_agents = {}
 
     # Structured output tool
     async def _ainvoke_and_parse(self, system_prompt: str, user_content: str, model_type: Type[BaseModel], retries: int = 2) -> BaseModel:
@@ -79,9 +117,18 @@ class LLMService(SingletonService):
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_content)
             ]
-            response = await self.llm.ainvoke(messages)
+            # Shared across every structured call, so gathered batches cannot flood the API
+            async with self._llm_slots:
+                response = await self.llm.ainvoke(messages)
             raw = response.content if hasattr(
                 response, 'content') else str(response)
+            if isinstance(raw, str):
+                # Well-formed replies parse and validate in one pass in pydantic-core;
+                # json_repair is only needed for fenced or broken JSON
+                try:
+                    return model_type.model_validate_json(raw)
+                except ValidationError:
+                    pass
             try:
                 data = json_repair_loads(raw)
                 return model_type.model_validate(data)
@@ -101,10 +148,21 @@ class LLMService(SingletonService):
 
     def _build_system_prompt_with_schema(self, template_name: str, replacements: Dict[str, str], schema_model: Type[BaseModel]) -> str:
         """Load template, replace variables, and append Schema."""
-        tpl = self._load_prompt(template_name)
-        for k, v in replacements.items():
-            tpl = tpl.replace(k, v)
-        return append_output_schema_to_prompt(tpl, schema_model)
+        # Templates and schema suffixes are cached; replacements carry per-request content
+        # (whole stories, scene lists), so the assembled prompt is not memoized
+        return append_output_schema_to_prompt(
+            _fill_placeholders(self._load_prompt(template_name), replacements), schema_model)
+
+    def _preload_prompts(self) -> None:
+        """Cache every .txt template in the prompts directory"""
+        try:
+            with os.scandir(self.prompts_dir) as it:
+                names = [e.name for e in it if e.name.endswith('.txt') and e.is_file()]
+        except FileNotFoundError:
+            logger.warning(f"Prompt directory does not exist: {self.prompts_dir}")
+            return
+        for name in names:
+            self._load_prompt(name)
 
     def _load_prompt(self, prompt_file: str) -> str:
         """Load prompt template"""
@@ -127,37 +185,49 @@ class LLMService(SingletonService):
         if tools is None or len(tools) == 0:
             return self.agent
 
-        agent = initialize_agent(
-            tools=tools,
-            llm=self.llm,
-            agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-            verbose=False,  # Whether to print detailed logs
-            handle_parsing_errors=True,
-
-        )
+        # KGService builds its tools once, so extract_character hits the same key every call
+        key = tuple(id(t) for t in tools)
+        agent = self._tool_agents.get(key)
+        if agent is None:
+            agent = initialize_agent(
+                tools=tools,
+                llm=self.llm,
+                agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
+                verbose=False,  # Whether to print detailed logs
+                handle_parsing_errors=True,
+
+            )
+            # The executor holds the tools, so their ids cannot be reused while cached
+            self._tool_agents[key] = agent
 
         return agent
 
     async def _process_text_stream(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
         """Process text stream"""
-        callback = AsyncIteratorCallbackHandler()
-        # Use asyncio.create_task to run LLM call, so callback.aiter() can start iterating immediately
-        task = asyncio.create_task(
-            self.llm.ainvoke(messages, config={"callbacks": [callback]})
-        )
-        async for token in callback.aiter():
-            yield token
-        # Ensure LLM call task completes
-        await task
+        # astream yields chunks as they arrive, without a callback queue and a side task;
+        # a few tokens are joined per yield so each SSE event carries more than one token
+        pending = []
+        async for chunk in self.llm.astream(messages):
+            token = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            if not isinstance(token, str):
+                token = str(token)
+            if not token:
+                continue
+            pending.append(token)
+            # Flush at line breaks too, so paragraphs show up as soon as they end
+            if len(pending) >= STREAM_COALESCE_TOKENS or '\n' in token:
+                yield ''.join(pending)
+                pending.clear()
+        if pending:
+            yield ''.join(pending)
 
     async def split_text_and_generate_prompts(self, project_name: str, text: str) -> List[dict]:
         """Split text and generate descriptions"""
         window_size = self.config['llm'].get('window_size', -1)
 
         # Preprocess text
-        split_pattern = r'(?<=[。！？])\s*'
         sentences = [s.replace('\n', ' ').strip()
-                     for s in re.split(split_pattern, text) if s.strip()]
+                     for s in SENTENCE_SPLIT_RE.split(text) if s.strip()]
         text = "\n".join(sentences)
 
         # Scene extraction
@@ -169,12 +239,22 @@ class LLMService(SingletonService):
         )
 
         # Use structured call
-        scene_result = await self._ainvoke_and_parse(system_prompt_for_scene, f"Project name: {project_name}\n\n{text}", SceneExtractionResult)
-        self.scene_service.update_scenes(project_name, scene_result.root)
+        scene_call = self._ainvoke_and_parse(system_prompt_for_scene, f"Project name: {project_name}\n\n{text}", SceneExtractionResult)
+        # Overlapping saves one LLM round trip, but the descriptions then only see the
+        # scenes known before this text, so it is opt-in (config.llm.overlap_scene_extraction)
+        overlap = bool(self.config['llm'].get('overlap_scene_extraction', False))
+        if overlap:
+            scene_task = asyncio.create_task(scene_call)
+        else:
+            scene_result = await scene_call
+            await asyncio.to_thread(
+                self.scene_service.update_scenes, project_name, scene_result.root)
+            # update_scenes only appends names it did not know, so merge locally in the same order
+            known = set(scene_names)
+            scene_names += [name for name in scene_result.root if name and name not in known]
 
         # Text description generation (using Pydantic structured output)
         entities_names = self.kg_service.inquire_entity_names(project_name)
-        scene_names = self.scene_service.get_scene_names(project_name)
         current_text_desc_prompt = self._build_system_prompt_with_schema(
             "text_desc_prompt.txt",
             {"{scenes}": ",".join(scene_names),
@@ -191,13 +271,19 @@ class LLMService(SingletonService):
         async def process_chunk_structured(chunk: str):
             try:
                 result: TextDescResult = await self._ainvoke_and_parse(current_text_desc_prompt, chunk, TextDescResult)
-                return [span.model_dump() for span in result.spans]
+                # TextSpan is flat (three str fields): dict() copies them without the serializer
+                return [dict(span) for span in result.spans]
             except Exception as e:
                 logger.error(
                     f"Structured parsing of text description failed: {e}")
                 return []
 
         results = await asyncio.gather(*[process_chunk_structured(chunk) for chunk in text_chunks])
+        if overlap:
+            # process_chunk_structured never raises, so a scene failure surfaces here as before
+            scene_result = await scene_task
+            await asyncio.to_thread(
+                self.scene_service.update_scenes, project_name, scene_result.root)
         return [item for sublist in results for item in sublist]
 
     async def generate_text(self, prompt: str, project_name: str, last_content: str = '') -> AsyncGenerator[str, None]:
@@ -206,8 +292,8 @@ class LLMService(SingletonService):
             raise ValueError("Prompt cannot be empty")
 
         system_prompt = self._load_prompt('novel_writing.txt')
-        system_prompt = system_prompt.replace('{context}', last_content)
-        system_prompt = system_prompt.replace('{requirements}', prompt)
+        system_prompt = _fill_placeholders(
+            system_prompt, {'{context}': last_content, '{requirements}': prompt})
 
         async for token in self._process_text_stream(self.combine_prompts(system_prompt, prompt)):
             yield token
@@ -242,16 +328,17 @@ class LLMService(SingletonService):
 
         system_prompt = self._load_prompt('character_extraction.txt')
 
-        # Get existing entities and locked entities
-        entities = ",".join(self.kg_service.inquire_entity_names(project_name))
+        # Get existing entities and locked entities; the first KG call may load kg.json and
+        # replay its journal, so it runs off the event loop (later calls hit the cache)
+        entities = ",".join(await asyncio.to_thread(
+            self.kg_service.inquire_entity_names, project_name))
         locked_entities = ",".join(
             self.kg_service.get_locked_entities(project_name))
 
         # Fill prompt variables
-        system_prompt = system_prompt.replace(
-            "{{entities}}", json.dumps(entities, ensure_ascii=False))
-        system_prompt = system_prompt.replace(
-            "{{locked_entities}}", json.dumps(locked_entities, ensure_ascii=False))
+        # The template lists them as plain comma-separated names
+        system_prompt = _fill_placeholders(
+            system_prompt, {"{{entities}}": entities, "{{locked_entities}}": locked_entities})
         # Append output Schema (summary JSON)
         system_prompt = append_output_schema_to_prompt(
             system_prompt, CharacterExtractionSummary)
@@ -276,17 +363,10 @@ class LLMService(SingletonService):
             logger.warning(f"Parsing character extraction summary failed: {e}")
 
         # Get results
-        entities = json.loads(
-            self.kg_service.inquire_entity_list(project_name))
-        relationships = {
-            entity['name']: json.loads(self.kg_service.inquire_entity_relationships(
-                project_name=project_name,
-                name=entity['name']
-            ))
-            for entity in entities if isinstance(entity, dict) and 'name' in entity
-        }
+        entities = self.kg_service.inquire_entity_list(project_name)
+        relationships = self.kg_service.inquire_all_relationships(project_name)
 
-        self.kg_service.save_kg(project_name)
+        await self.kg_service.save_kg_async(project_name)
 
         return {
             'result': final_answer,
@@ -295,14 +375,14 @@ class LLMService(SingletonService):
             'relationships': relationships
         }
 
-    async def _translate_prompt_batch(self, project_name: str, prompts: List[str], system_prompt: str, entities: List[dict]) -> List[str]:
+    async def _translate_prompt_batch(self, project_name: str, prompts: List[str], system_prompt: str, entity_descriptions: Dict[str, str]) -> List[str]:
         """
         Batch translate prompts
         Args:
             project_name: Project name
             prompts: List of prompts
             system_prompt: System prompt template
-            entities: List of entity information
+            entity_descriptions: Entity name -> description
         Returns:
             List of translated prompts
         """
@@ -311,19 +391,14 @@ class LLMService(SingletonService):
             all_entity_names = set()
             all_scene_names = set()
             for prompt in prompts:
-                entity_names = re.findall(r'\{([^}]+)\}', prompt)
+                entity_names = ENTITY_RE.findall(prompt)
                 all_entity_names.update(entity_names)
-                scene_names = re.findall(r'\$\$([^$]+)\$\$', prompt)
+                scene_names = SCENE_DOLLAR_RE.findall(prompt)
                 all_scene_names.update(scene_names)
 
             # Find corresponding entity information
-            entity_infos = []
-            for name in all_entity_names:
-                for entity in entities:
-                    if entity['name'] == name:
-                        info_str = f"{entity['name']}: {entity.get('attributes', {}).get('description', '')}"
-                        entity_infos.append(info_str)
-                        break
+            entity_infos = [f"{name}: {entity_descriptions[name]}"
+                            for name in all_entity_names if name in entity_descriptions]
 
             scene_dict = self.scene_service.get_scene_dict(
                 project_name, all_scene_names)
@@ -379,9 +454,6 @@ class LLMService(SingletonService):
 
                 translated_prompts.extend(batch_results)
 
-                if batch_index < total_batches - 1:
-                    await asyncio.sleep(0.5)
-
             if len(translated_prompts) != len(prompts):
                 raise Exception(
                     f"Total translation result count ({len(translated_prompts)}) does not match input count ({len(prompts)})")
@@ -392,37 +464,24 @@ class LLMService(SingletonService):
             logging.error(f'Batch translation of prompts failed: {str(e)}')
             raise
 
-    async def _translate_prompt_batch_reference_image(self, project_name: str, prompts: List[str], system_prompt: str, entities: List[dict]) -> List[str]:
+    async def _translate_prompt_batch_reference_image(self, project_name: str, prompts: List[str], system_prompt: str, entity_infos: Dict[str, str], scene_infos: Dict[str, str]) -> List[str]:
         """
         Batch translate prompts
         Args:
             project_name: Project name
             prompts: List of prompts
             system_prompt: System prompt template
-            entities: List of entity information
+            entity_infos: Entity name -> first clause of its description
+            scene_infos: Scene name -> first clause of its description
         Returns:
             List of translated prompts
         """
         try:
-            # Find corresponding entity information
-            entity_infos = {}
-            for entity in entities:
-                info_str = entity.get('attributes', {}).get('description', '')
-                info_str_list = info_str.split(",")
-                info_str = info_str_list[0]
-
-                entity_infos[entity['name']] = info_str
-
-            scene_infos = self.scene_service.load_scenes(project_name)
-            for scene_name, des in scene_infos.items():
-                des_list = des.split(",")
-                scene_infos[scene_name] = des_list[0]
-
             # Replace entity markers in each prompt
             processed_prompts = []
             for prompt in prompts:
-                entity_names = re.findall(r'\{([^}]+)\}', prompt)
-                scene_names = re.findall(r'\[([^$]+)\]', prompt)
+                entity_names = ENTITY_RE.findall(prompt)
+                scene_names = SCENE_BRACKET_RE.findall(prompt)
                 processed_prompt = prompt
                 for name in entity_names:
                     if name in entity_infos:
@@ -469,7 +528,8 @@ class LLMService(SingletonService):
                 # Parse once, retry if necessary
                 attempt = 0
                 while True:
-                    result_model: PromptKontextList = await self._ainvoke_and_parse(current_system_prompt, prompts_str, PromptKontextList, retries=self.parse_retries)
+                    # The prompt asks for the full PromptKontextList; only the answers are validated
+                    result_model: PromptKontextAnswerList = await self._ainvoke_and_parse(current_system_prompt, prompts_str, PromptKontextAnswerList, retries=self.parse_retries)
                     batch_results = [item.answer for item in result_model.root]
                     if len(batch_results) == len(batch_prompts):
                         break
@@ -482,9 +542,6 @@ class LLMService(SingletonService):
 
                 translated_prompts.extend(batch_results)
 
-                if batch_index < total_batches - 1:
-                    await asyncio.sleep(0.5)
-
             if len(translated_prompts) != len(prompts):
                 raise Exception(
                     f"Total translation result count ({len(translated_prompts)}) does not match input count ({len(prompts)})")
@@ -514,34 +571,55 @@ class LLMService(SingletonService):
             else:
                 system_prompt = self._load_prompt('prompt_translation.txt')
 
-            # Get all entity information from knowledge graph
-            entities_json = self.kg_service.inquire_entity_list(project_name)
-            entities = json.loads(entities_json)
+            # Get all entity information from knowledge graph, keyed once for every batch
+            entities = self.kg_service.inquire_entity_list(project_name)
+            if reference_image_mode:
+                # Only the first clause of each description goes into the edit instructions
+                entity_infos = {
+                    entity['name']: entity.get('attributes', {}).get('description', '').split(',', 1)[0]
+                    for entity in entities}
+                # A new dict: load_scenes hands out the service's cached scenes
+                scene_infos = {
+                    scene_name: des.split(',', 1)[0]
+                    for scene_name, des in self.scene_service.load_scenes(project_name).items()}
+            else:
+                # The first entity with a name wins
+                entity_descriptions = {}
+                for entity in entities:
+                    entity_descriptions.setdefault(
+                        entity['name'], entity.get('attributes', {}).get('description', ''))
 
-            # Split prompt list into groups
+            # Split prompt list into groups of similar length: a batch takes as long as its
+            # longest prompt, so mixing short and long prompts makes every group wait on the tail
+            # Repeated shots produce identical prompts; each distinct prompt is translated once
+            unique_prompts = list(dict.fromkeys(prompts))
             batch_size = 8
-            batches = [prompts[i:i + batch_size]
-                       for i in range(0, len(prompts), batch_size)]
+            order = sorted(range(len(unique_prompts)), key=lambda i: len(unique_prompts[i]))
+            groups = [order[i:i + batch_size]
+                      for i in range(0, len(order), batch_size)]
 
             # Process each batch in parallel
             tasks = []
-            for batch in batches:
+            for group in groups:
+                batch = [unique_prompts[i] for i in group]
                 if reference_image_mode:
                     tasks.append(self._translate_prompt_batch_reference_image(
-                        project_name, batch, system_prompt, entities))
+                        project_name, batch, system_prompt, entity_infos, scene_infos))
                 else:
                     tasks.append(self._translate_prompt_batch(
-                        project_name, batch, system_prompt, entities))
+                        project_name, batch, system_prompt, entity_descriptions))
 
             # Execute all tasks
             results = await asyncio.gather(*tasks)
 
-            # Merge results from all batches
-            translated_prompts = []
-            for batch_result in results:
-                translated_prompts.extend(batch_result)
+            # Merge results from all batches back into input order. Zipping by position is safe
+            # because each batch call raises unless it returns exactly one translation per prompt
+            translated_by_prompt = {}
+            for group, batch_result in zip(groups, results):
+                for i, translated in zip(group, batch_result):
+                    translated_by_prompt[unique_prompts[i]] = translated
 
-            return translated_prompts
+            return [translated_by_prompt[prompt] for prompt in prompts]
 
         except Exception as e:
             logging.error(f'Translation of prompts failed: {str(e)}')
@@ -549,9 +627,6 @@ class LLMService(SingletonService):
 
     async def split_story_into_chapters(self, story_content: str) -> List[str]:
         """Split story into chapters using LLM, each <= 200 words"""
-        prompt_template = self._load_prompt('story_split.txt')
-        prompt = prompt_template.replace('{story_content}', story_content)
-
         # Định nghĩa schema cho kết quả (thêm vào schemas.py nếu chưa có)
         # Giả sử đã thêm vào schemas.py
         from server.services.schemas import StorySplitResult
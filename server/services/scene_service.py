@@ -1,6 +1,6 @@
 import os
-import json
-from server.config.config import load_config
+import threading
+from server.utils.file_io import read_json, write_json
 from typing import Dict, List
 from .base_service import SingletonService
 import logging
@@ -10,8 +10,17 @@ logger = logging.getLogger(__name__)
 
 class SceneService(SingletonService):
     def _initialize(self):
-        self.config = load_config()
         self.scenes_cache = {}
+        self._project_locks = {}  # Serializes scenes.json read-modify-writes per project
+        self._project_locks_lock = threading.Lock()
+
+    def _project_lock(self, project_name: str) -> threading.Lock:
+        """Per-project lock guarding the cached scenes dict and scenes.json"""
+        lock = self._project_locks.get(project_name)
+        if lock is None:
+            with self._project_locks_lock:
+                lock = self._project_locks.setdefault(project_name, threading.Lock())
+        return lock
 
     def _get_scene_path(self, project_name: str) -> str:
         return os.path.join(self.config['projects_path'], project_name, 'scenes.json')
@@ -19,7 +28,13 @@ class SceneService(SingletonService):
     def load_scenes(self, project_name: str) -> Dict[str, str]:
         """
         Load scene information for a project.
+
+        Returns a shallow copy, so callers cannot alter the cached scenes.
         """
+        return dict(self._scenes(project_name))
+
+    def _scenes(self, project_name: str) -> Dict[str, str]:
+        """Cached scenes dict itself, loading it on first use; only this service mutates it"""
         if project_name in self.scenes_cache:
             return self.scenes_cache[project_name]
 
@@ -30,8 +45,7 @@ class SceneService(SingletonService):
             self.scenes_cache[project_name] = default_scenes
             return default_scenes
 
-        with open(scenes_path, 'r', encoding='utf-8') as f:
-            scenes = json.load(f)
+        scenes = read_json(scenes_path)
 
         self.scenes_cache[project_name] = scenes
         return scenes
@@ -40,65 +54,75 @@ class SceneService(SingletonService):
         """
         Update scene information for a project.
         """
-        try:
-            scenes_path = self._get_scene_path(project_name)
-            scenes = self.load_scenes(project_name)
-
-            for scene_name, scene_desc in new_scenes.items():
-                if scene_name:
-                    if not force_update and scene_name in scenes:
-                        continue
-                    scenes[scene_name] = scene_desc
-                    logger.info(f"Updated scene: {scene_name}, {scene_desc}")
-
-            self.scenes_cache[project_name] = scenes
-
-            with open(scenes_path, 'w', encoding='utf-8') as f:
-                json.dump(scenes, f, ensure_ascii=False, indent=2)
-
+        if not new_scenes:
             return True
-        except Exception as e:
-            logger.error(f"Error updating scene information: {str(e)}")
-            raise e
+        with self._project_lock(project_name):
+            try:
+                scenes_path = self._get_scene_path(project_name)
+                scenes = self._scenes(project_name)
+
+                changed = False
+                for scene_name, scene_desc in new_scenes.items():
+                    if scene_name:
+                        if not force_update and scene_name in scenes:
+                            continue
+                        if scenes.get(scene_name) == scene_desc:
+                            continue
+                        scenes[scene_name] = scene_desc
+                        changed = True
+                        logger.info(f"Updated scene: {scene_name}, {scene_desc}")
+
+                self.scenes_cache[project_name] = scenes
+
+                # Extraction mostly re-reports known scenes; only rewrite scenes.json on a change
+                if changed:
+                    write_json(scenes_path, scenes)
+
+                return True
+            except Exception as e:
+                logger.error(f"Error updating scene information: {str(e)}")
+                raise e
 
     def delete_scenes(self, project_name: str, scene_names: List[str]) -> bool:
         """
         Delete scene information for a project.
         """
-        try:
-            scenes = self.load_scenes(project_name)
+        with self._project_lock(project_name):
+            try:
+                scenes = self._scenes(project_name)
 
-            for scene_name in scene_names:
-                if scene_name in scenes:
-                    del scenes[scene_name]
+                changed = False
+                for scene_name in scene_names:
+                    if scene_name in scenes:
+                        del scenes[scene_name]
+                        changed = True
 
-            self.scenes_cache[project_name] = scenes
-            scenes_path = self._get_scene_path(project_name)
+                self.scenes_cache[project_name] = scenes
 
-            with open(scenes_path, 'w', encoding='utf-8') as f:
-                json.dump(scenes, f, ensure_ascii=False, indent=2)
-            return True
-        except Exception as e:
-            logger.error(f"Error deleting scene information: {str(e)}")
-            raise e
+                if changed:
+                    write_json(self._get_scene_path(project_name), scenes)
+                return True
+            except Exception as e:
+                logger.error(f"Error deleting scene information: {str(e)}")
+                raise e
 
     def get_scene_names(self, project_name: str) -> List[str]:
         """
         Get all scene names for a project.
         """
-        scenes = self.load_scenes(project_name)
+        scenes = self._scenes(project_name)
         return list(scenes.keys())
 
     def get_scene_descs(self, project_name: str, scene_names: List[str]) -> List[str]:
         """
         Get descriptions for multiple scenes in a project.
         """
-        scenes = self.load_scenes(project_name)
+        scenes = self._scenes(project_name)
         return [scenes[scene_name] for scene_name in scene_names if scene_name in scenes]
 
     def get_scene_dict(self, project_name: str, scene_names: List[str]) -> Dict[str, str]:
         """
         Get dictionary of scenes for a project.
         """
-        scenes = self.load_scenes(project_name)
+        scenes = self._scenes(project_name)
         return {scene_name: scenes[scene_name] for scene_name in scene_names if scene_name in scenes}
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import functools
 import json
 from typing import Dict, List, Optional
 from pydantic import BaseModel, RootModel, Field, ConfigDict
@@ -7,7 +8,7 @@ from pydantic import BaseModel, RootModel, Field, ConfigDict
 
 
 class SceneExtractionResult(RootModel[Dict[str, str]]):
-    model_config = ConfigDict(json_schema_extra={
+    model_config = ConfigDict(defer_build=True, json_schema_extra={
         "title": "SceneExtractionResult",
         "description": "Ánh xạ tên cảnh (bằng tiếng Việt) sang mô tả hình ảnh ngắn gọn bằng tiếng Anh. Chỉ mô tả môi trường; không mô tả nhân vật.",
         "examples": [
@@ -43,7 +44,7 @@ class TextDescResult(BaseModel):
 
 # Danh sách prompt dịch thường: list string
 class PromptList(RootModel[List[str]]):
-    model_config = ConfigDict(json_schema_extra={
+    model_config = ConfigDict(defer_build=True, json_schema_extra={
         "title": "PromptList",
         "description": "Translated prompts list in English; each item is a concise, comma-separated prompt without trailing periods.",
         "examples": [[
@@ -65,7 +66,7 @@ class PromptKontextItem(BaseModel):
 
 
 class PromptKontextList(RootModel[List[PromptKontextItem]]):
-    model_config = ConfigDict(json_schema_extra={
+    model_config = ConfigDict(defer_build=True, json_schema_extra={
         "title": "PromptKontextList",
         "description": "List of FLUX.1 Kontext edit instructions per input item.",
         "examples": [[
@@ -79,12 +80,26 @@ class PromptKontextList(RootModel[List[PromptKontextItem]]):
     })
 
 
+# Chỉ dùng khi phân tích phản hồi Kontext: prompt vẫn gửi schema đầy đủ của PromptKontextList,
+# nhưng chỉ trường answer được đọc, các trường khác (thinking, ...) bị bỏ qua khi validate
+class PromptKontextAnswer(BaseModel):
+    answer: str
+
+
+class PromptKontextAnswerList(RootModel[List[PromptKontextAnswer]]):
+    model_config = ConfigDict(defer_build=True)
+
+
+@functools.lru_cache(maxsize=64)
+def _output_schema_suffix(model_type: type[BaseModel]) -> str:
+    """Phần JSON Schema nối vào prompt; model_json_schema() chỉ chạy một lần cho mỗi model."""
+    schema_json = json.dumps(model_type.model_json_schema(), ensure_ascii=False)
+    return "\n-OutputFormat: Vui lòng trả kết quả đúng theo Json Schema dưới đây\n" + schema_json
+
+
 def append_output_schema_to_prompt(prompt: str, model_type: type[BaseModel]) -> str:
     """Thêm JSON Schema vào cuối prompt, để LLM xuất kết quả đúng định dạng."""
-    schema_dict = model_type.model_json_schema()
-    schema_json = json.dumps(schema_dict, ensure_ascii=False)
-    suffix = "\n-OutputFormat: Vui lòng trả kết quả đúng theo Json Schema dưới đây\n" + schema_json
-    return prompt.rstrip() + suffix
+    return prompt.rstrip() + _output_schema_suffix(model_type)
 
 
 # Tóm tắt thay đổi quan hệ nhân vật
@@ -136,3 +151,20 @@ class StorySplitResult(BaseModel):
             }
         ]
     })
+
+
+# Các RootModel chỉ dùng để phân tích đầu ra LLM được khai báo defer_build=True, nên import không
+# phải dựng schema của chúng. Lifespan của app gọi warm_schemas() để dựng sẵn mọi schema
+# (model_rebuild cho model còn hoãn, JSON Schema nối vào prompt vào cache của _output_schema_suffix)
+# trước khi nhận request, để request đầu tiên không phải trả chi phí này
+SCHEMAS = (SceneExtractionResult, TextSpan, TextDescResult, PromptList, PromptKontextItem,
+           PromptKontextList, PromptKontextAnswer, PromptKontextAnswerList, RelationshipChange,
+           CharacterExtractionSummary, StoryChapter, StorySplitResult)
+
+
+def warm_schemas():
+    """Build every deferred schema and cache its prompt suffix"""
+    for model in SCHEMAS:
+        if not model.__pydantic_complete__:
+            model.model_rebuild()
+        _output_schema_suffix(model)
@@ -2,17 +2,29 @@ import logging
 import os
 import time
 import numpy as np
+import orjson
+import queue
+import re
 import subprocess
+import sys
 import threading
 import asyncio
-import gc
-from typing import List, Dict, Optional, Tuple
+import collections
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Optional, Tuple
 from PIL import Image
-from moviepy import ImageSequenceClip, AudioFileClip, CompositeAudioClip, AudioArrayClip
 from server.utils.image_effect import ImageEffects
 
 logger = logging.getLogger(__name__)
 
+# "Duration: 00:01:02.35" line of `ffmpeg -i` input info; N/A never matches
+DURATION_RE = re.compile(r'Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)')
+# Lines of ffmpeg stderr kept for error reports; a long merge can print megabytes
+FFMPEG_STDERR_LINES = 4096
+# Consumer NVENC chips cap concurrent encode sessions; extra ffmpeg processes fail to open one
+NVENC_SESSIONS = 3
+
 
 class VideoService:
     """Video Generation Service"""
@@ -29,7 +41,15 @@ class VideoService:
             'use_pan': True,
             # 50% of original image range for horizontal pan, 50% for vertical
             'pan_range': (0.5, 0.5),
+            # Filter for the one-time segment resize: 'fast', 'balanced' or 'high' (LANCZOS)
+            'resize_quality': 'balanced',
         }
+        # Segment loading, rendering and encoding block a thread each for seconds; a pool of
+        # their own keeps them from starving the default executor that request handlers use
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.default_settings['batch_size'], thread_name_prefix='video')
+        # libx264 encodes are already capped by the executor's worker count
+        self._nvenc_slots = asyncio.Semaphore(NVENC_SESSIONS)
         self.stop_flag = threading.Event()
         self.cuda_available = self._check_hardware()
         # Progress tracking
@@ -76,62 +96,67 @@ class VideoService:
             image = img.copy()
             # image = img.resize(resolution, Image.LANCZOS)
 
-        # Load audio
-        audio = AudioFileClip(audio_path)
-        if audio.duration is None or audio.duration < 0.05:
-            audio.close()  # Release file handle
+        # Probe audio duration only; ffmpeg muxes the mp3 itself when writing the segment
+        try:
+            duration = self._probe_duration(audio_path)
+        except Exception:
+            image.close()
+            raise
+        if duration is None or duration < 0.05:
+            image.close()
             raise ValueError(
                 f"Audio file duration too short or invalid: {audio_path}")
 
-        return image, audio
+        return image, duration
 
-    async def _process_segment(self, subdir: str, temp_dir: str, settings: Dict) -> Optional[Tuple[str, str]]:
+    @staticmethod
+    def _probe_duration(path: str) -> Optional[float]:
+        """
+        Container duration in seconds as reported by `ffmpeg -i`, or None if it has none
+        Uses the same ffmpeg binary as encoding, so no separate ffprobe is required
+        """
+        try:
+            # Without an output file ffmpeg exits non-zero after printing the input info
+            result = subprocess.run(
+                ['ffmpeg', '-hide_banner', '-i', path], capture_output=True, text=True, errors='replace')
+        except FileNotFoundError:
+            raise RuntimeError("ffmpeg executable not found on PATH, required for video generation")
+        match = DURATION_RE.search(result.stderr)
+        if not match:
+            return None
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    async def _process_segment(self, subdir: str, temp_dir: str, settings: Dict) -> Optional[str]:
         """Process a single video segment"""
         # Add subdir for uniqueness
         temp_file = os.path.join(temp_dir, f"vid_{subdir}_{os.getpid()}.mp4")
-        temp_audio_path = os.path.join(
-            os.path.dirname(temp_file),
-            f"temp_audio_{subdir}_{os.getpid()}_{time.time_ns()}.m4a"
-        )
+        subdir_path = os.path.join(settings['chapter_path'], subdir)
         start_time = time.time()
-        frames = []
         image = None
-        audio = None
 
         try:
             # Load resources in thread
             loop = asyncio.get_running_loop()
-            image, audio = await loop.run_in_executor(
-                None,
-                lambda: self._load_resources(os.path.join(
-                    settings['chapter_path'], subdir), settings['resolution'])
+            image, duration = await loop.run_in_executor(
+                self._executor,
+                lambda: self._load_resources(subdir_path, settings['resolution'])
             )
 
-            duration = audio.duration
             total_frames = int(duration * settings['fps'])
             if total_frames == 0:
                 raise ValueError(
                     f"Calculated total frames is 0, video duration too short. Subdir: {subdir}")
 
-            # Generate frames in batch
-            for i in range(total_frames):
-                if self.stop_flag.is_set():
-                    break
-                # Process image in thread
-                frame = await loop.run_in_executor(
-                    None,
-                    lambda: self._apply_effects(
-                        image.copy(), i/settings['fps'], duration, settings, subdir)
+            # Render and encode in one thread hop: frames are piped to ffmpeg as they are made
+            use_nvenc = settings.get('use_cuda', False) and self.cuda_available
+            async with self._nvenc_slots if use_nvenc else contextlib.nullcontext():
+                await loop.run_in_executor(
+                    self._executor,
+                    lambda: self._write_temp_video(
+                        self._render_frames(image, total_frames, duration, settings, subdir),
+                        os.path.join(subdir_path, "audio.mp3"), temp_file, settings)
                 )
-                frames.append(np.array(frame))
-                frame.close()
-
-            # Write video
-            await loop.run_in_executor(
-                None,
-                lambda: self._write_temp_video(
-                    frames, audio, temp_file, temp_audio_path, settings)
-            )
 
             logger.info("Completed segment %s | Time taken: %.1fs | Size: %.1fMB",
                         subdir, time.time()-start_time, os.path.getsize(temp_file)/1024/1024)
@@ -140,49 +165,90 @@ class VideoService:
             with self.task_lock:
                 self.progress += 1
 
-            return temp_file, temp_audio_path
+            return temp_file
 
         finally:
             # Release memory resources only, no file deletion handling
             if image:
                 image.close()
-            if audio:
-                audio.close()
-            del frames
-            gc.collect()
 
-    def _write_temp_video(self, frames: list, audio: AudioFileClip, output_path: str, temp_audio_path: str, settings: Dict):
+    def _write_temp_video(self, frames: Iterator[np.ndarray], audio_path: str, output_path: str, settings: Dict):
         """
         Safely write video segment
-        Use temporary file to store, avoiding high memory usage
+        Frames are streamed to ffmpeg's stdin as raw RGB by a writer thread, so only
+        a short queue of frames is held in memory
         """
-        with ImageSequenceClip(frames, fps=settings['fps']) as video_clip:
-            # Use .with_duration() to precisely and safely align audio-video duration
-            # Elegantly handles duration mismatches by padding with silence or truncating
-            final_audio = audio.with_duration(video_clip.duration)
-
-            # Bind audio
-            final_clip = video_clip.with_audio(final_audio)
-
-            # Set encoding parameters
-            ffmpeg_params = []
-            if settings.get('use_cuda', False) and self.cuda_available:
-                ffmpeg_params.extend(
-                    ['-c:v', 'h264_nvenc', '-preset', 'medium'])
-            else:
-                ffmpeg_params.extend(
-                    ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23'])
-            print("reach _write_temp_video ")
-            # Write file
-            final_clip.write_videofile(
-                output_path,
-                codec='h264_nvenc',
-                audio_codec='aac',
-                temp_audiofile=temp_audio_path,  # Explicitly specify temporary audio file path
-                threads=settings.get('threads', 4),
-                ffmpeg_params=ffmpeg_params,
-                logger=None
-            )
+        first = next(frames, None)
+        if first is None:
+            raise ValueError(f"No frames rendered for {output_path}")
+        height, width = first.shape[:2]
+
+        # Set encoding parameters
+        video_params = self._video_codec_params(settings)
+        if width % 2 == 0 and height % 2 == 0:
+            video_params.extend(['-pix_fmt', 'yuv420p'])
+
+        cmd = [
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{width}x{height}', '-r', str(settings['fps']),
+            '-i', '-',
+            '-i', audio_path,
+            '-map', '0:v:0', '-map', '1:a:0',
+            *video_params,
+            # The mp3 is stream-copied, not decoded and re-encoded
+            '-c:a', 'copy',
+            '-threads', str(settings.get('threads', 4)),
+            # Frame count is derived from the audio duration, so audio trims to the video
+            '-shortest',
+            output_path
+        ]
+
+        process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        # Drain stderr while frames are fed, so a chatty ffmpeg never stalls on a full pipe
+        stderr_tail = collections.deque(maxlen=FFMPEG_STDERR_LINES)
+        reader = threading.Thread(target=stderr_tail.extend, args=(process.stderr,),
+                                  name='video-ffmpeg-stderr', daemon=True)
+        reader.start()
+        # Rendering and pipe writes overlap through a bounded queue (about two seconds
+        # of frames), so memory stays flat while neither side waits on the other
+        pending = queue.Queue(maxsize=max(1, int(settings['fps']) * 2))
+
+        def feed_ffmpeg():
+            try:
+                while (chunk := pending.get()) is not None:
+                    process.stdin.write(chunk)
+            except OSError:
+                # ffmpeg exited early; its stderr below says why. Keep draining so the
+                # renderer never blocks on a full queue
+                while pending.get() is not None:
+                    pass
+
+        writer = threading.Thread(target=feed_ffmpeg, name='video-ffmpeg-feed', daemon=True)
+        writer.start()
+        try:
+            pending.put(np.ascontiguousarray(first).data)
+            for frame in frames:
+                pending.put(np.ascontiguousarray(frame).data)
+        finally:
+            pending.put(None)
+            writer.join()
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = process.wait()
+            reader.join()
+        stderr = b''.join(stderr_tail)
+
+        if returncode != 0:
+            # Decode error message
+            import locale
+            encoding = locale.getpreferredencoding()
+            logger.error("Segment encoding failed: %s",
+                         stderr.decode(encoding, errors='replace'))
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
 
     async def generate_video(self, chapter_path: str, video_settings: Dict = None) -> str:
         """Main video generation process"""
@@ -229,9 +295,8 @@ class VideoService:
                         logger.error(
                             "One video segment processing failed: %s", result)
                     elif result:
-                        video_path, audio_path = result
-                        temp_video_files.append(video_path)
-                        all_temp_files.extend([video_path, audio_path])
+                        temp_video_files.append(result)
+                        all_temp_files.append(result)
 
                 # Check for cancellation
                 if self.stop_flag.is_set():
@@ -255,7 +320,7 @@ class VideoService:
             # Perform merging
             loop = asyncio.get_running_loop()
             result = await loop.run_in_executor(
-                None,
+                self._executor,
                 lambda: self._merge_videos(
                     temp_video_files, output_path, final_settings)
             )
@@ -274,7 +339,96 @@ class VideoService:
             # Clean up temporary files
             if all_temp_files:
                 loop = asyncio.get_running_loop()
-                await loop.run_in_executor(None, self._cleanup_temp_files, all_temp_files)
+                await loop.run_in_executor(self._executor, self._cleanup_temp_files, all_temp_files)
+
+    def _video_codec_params(self, settings: Dict) -> List[str]:
+        """FFmpeg video encoder arguments for NVENC or libx264"""
+        if settings.get('use_cuda', False) and self.cuda_available:
+            # p1-p7 are NVENC's own presets (the legacy 'medium' maps to the slow end);
+            # frames arrive as host rgb24, so there is no CUDA surface to upload
+            return ['-c:v', 'h264_nvenc', '-preset', 'p4', '-tune', 'll',
+                    '-rc', 'vbr', '-b:v', '8M', '-surfaces', '32', '-gpu', '0']
+        return ['-c:v', 'libx264', '-preset', 'medium', '-crf', '23']
+
+    @staticmethod
+    def _probe_stream_params(path: str) -> Tuple:
+        """Codec parameters of every stream in a file, as a hashable value for comparison"""
+        output = subprocess.check_output([
+            'ffprobe', '-v', 'error',
+            '-show_entries',
+            'stream=codec_type,codec_name,profile,width,height,pix_fmt,sample_rate,channels',
+            '-of', 'json', path
+        ])
+        return tuple(tuple(sorted(stream.items()))
+                     for stream in orjson.loads(output).get('streams', []))
+
+    def _segments_share_params(self, temp_files: List[str]) -> bool:
+        """Whether every segment can be joined by the concat demuxer with -c copy"""
+        try:
+            with ThreadPoolExecutor(max_workers=min(8, len(temp_files)),
+                                    thread_name_prefix='video-probe') as pool:
+                params = set(pool.map(self._probe_stream_params, temp_files))
+        except FileNotFoundError:
+            # ffprobe is optional; segments of one job share their encoder settings
+            logger.warning("ffprobe not found, merging segments without comparing codec parameters")
+            return True
+        return len(params) == 1
+
+    def _reencode_merge_cmd(self, temp_files: List[str], output_path: str, settings: Dict) -> List[str]:
+        """Concat filter command that scales every segment to the first one's size and re-encodes"""
+        first_video = next(dict(stream) for stream in self._probe_stream_params(temp_files[0])
+                           if dict(stream).get('codec_type') == 'video')
+        # yuv420p needs even dimensions
+        width, height = first_video['width'] // 2 * 2, first_video['height'] // 2 * 2
+
+        cmd = ['ffmpeg']
+        filters = []
+        for i, file in enumerate(temp_files):
+            cmd.extend(['-i', file])
+            filters.append(
+                f"[{i}:v:0]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,format=yuv420p[v{i}];"
+                f"[{i}:a:0]aformat=sample_rates=44100:channel_layouts=stereo[a{i}]")
+        streams = ''.join(f"[v{i}][a{i}]" for i in range(len(temp_files)))
+        filters.append(f"{streams}concat=n={len(temp_files)}:v=1:a=1[v][a]")
+
+        cmd.extend([
+            '-filter_complex', ';'.join(filters),
+            '-map', '[v]', '-map', '[a]',
+            *self._video_codec_params(settings),
+            '-c:a', 'aac',
+            '-movflags', '+faststart',
+            '-y', output_path
+        ])
+        return cmd
+
+    def _run_ffmpeg(self, cmd: List[str]):
+        """
+        Run an ffmpeg command, keeping only the tail of its stderr for error reports
+        Cancelling generation terminates the process instead of waiting for it to finish
+        """
+        process = subprocess.Popen(
+            cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        stderr_tail = collections.deque(maxlen=FFMPEG_STDERR_LINES)
+        reader = threading.Thread(
+            target=stderr_tail.extend, args=(process.stderr,), name='video-ffmpeg-stderr', daemon=True)
+        reader.start()
+        try:
+            while True:
+                try:
+                    process.wait(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    if self.stop_flag.is_set():
+                        process.terminate()
+                        process.wait()
+                        raise ValueError("Video generation cancelled by user")
+        finally:
+            reader.join()
+
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(
+                process.returncode, cmd, stderr=b''.join(stderr_tail))
 
     def _merge_videos(self, temp_files: List[str], output_path: str, settings: Dict) -> str:
         """Merge video segments"""
@@ -292,20 +446,25 @@ class VideoService:
                     f.write(f"file '{file_path}'\n")
 
             # Build FFmpeg command
-            cmd = [
-                'ffmpeg',
-                '-f', 'concat',
-                '-safe', '0',
-                '-i', concat_list,
-                '-c', 'copy',
-                '-movflags', '+faststart',
-                '-y', temp_output_path
-            ]
-            if settings.get('use_cuda', False) and self.cuda_available:
-                cmd[1:1] = ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda']
+            if self._segments_share_params(temp_files):
+                # Stream copy is only valid when every segment has identical codec parameters
+                cmd = [
+                    'ffmpeg',
+                    '-f', 'concat',
+                    '-safe', '0',
+                    '-i', concat_list,
+                    '-c', 'copy',
+                    '-movflags', '+faststart',
+                    '-y', temp_output_path
+                ]
+            else:
+                # Mismatched segments (e.g. unpanned images of different sizes) would be
+                # stitched into a broken file without any error, so re-encode them instead
+                logger.warning("Segments differ in codec parameters, re-encoding merge")
+                cmd = self._reencode_merge_cmd(temp_files, temp_output_path, settings)
 
             # Execute command
-            subprocess.run(cmd, check=True, capture_output=True)
+            self._run_ffmpeg(cmd)
 
             # Atomically replace/rename file
             os.replace(temp_output_path, output_path)
@@ -327,21 +486,25 @@ class VideoService:
             if os.path.exists(temp_output_path):
                 os.remove(temp_output_path)
 
-    def _apply_effects(self, image: Image.Image, time_val: float,
-                       duration: float, settings: Dict, subdir: str) -> Image.Image:
-        """Apply video effects"""
+    def _render_frames(self, image: Image.Image, total_frames: int,
+                       duration: float, settings: Dict, subdir: str) -> Iterator[np.ndarray]:
+        """Apply video effects to every frame of a segment, yielding frames one at a time"""
         try:
             effect_params = {
                 'output_size': settings.get('resolution', self.default_settings['resolution']),
                 'fade_duration': settings.get('fade_duration', 1.0),
                 'use_pan': settings.get('use_pan', True),
                 'pan_range': settings.get('pan_range', (0.5, 0)),
-                'segment_index': int(subdir) if subdir.isdigit() else 0
+                'segment_index': int(subdir) if subdir.isdigit() else 0,
+                'resize_quality': settings.get('resize_quality', 'balanced'),
             }
 
-            return ImageEffects.apply_effects(
-                image, time_val, duration, effect_params
-            )
+            prepared = ImageEffects.prepare(image, duration, effect_params)
+            # Unfaded frames are views into the one scaled image, not copies
+            for frame in ImageEffects.iter_frames(prepared, total_frames, settings['fps']):
+                if self.stop_flag.is_set():
+                    break
+                yield frame
         except Exception as e:
             logger.error("Effect processing failed: %s", str(e))
             raise
@@ -364,26 +527,34 @@ class VideoService:
         return True
 
     def _cleanup_temp_files(self, files: List[str]):
-        """Robustly cleans up temporary files, with retries for locked files."""
-        for f_path in files:
-            if not os.path.exists(f_path):
-                continue
-
-            attempts = 3
-            for i in range(attempts):
-                try:
-                    os.remove(f_path)
-                    logger.debug("Cleaned up: %s", f_path)
-                    break  # Success
-                except PermissionError as e:  # Specifically catch PermissionError for retries
-                    if i < attempts - 1:
-                        logger.warning(
-                            "File locked, retrying in 0.5s: %s. Error: %s", f_path, e)
-                        time.sleep(0.5)
-                    else:
-                        logger.error(
-                            "Failed to delete file after multiple attempts: %s. Error: %s", f_path, e)
-                except Exception as e:
+        """Robustly cleans up temporary files, removing them in parallel."""
+        if not files:
+            return
+        with ThreadPoolExecutor(max_workers=min(8, len(files)),
+                                thread_name_prefix='video-cleanup') as pool:
+            # Consume the iterator so every removal finishes before returning
+            list(pool.map(self._remove_temp_file, files))
+
+    @staticmethod
+    def _remove_temp_file(f_path: str):
+        """Remove one temporary file; only Windows retries, where a finished ffmpeg can still hold a lock"""
+        attempts = 3 if sys.platform == 'win32' else 1
+        for i in range(attempts):
+            try:
+                os.unlink(f_path)
+                logger.debug("Cleaned up: %s", f_path)
+                return  # Success
+            except FileNotFoundError:
+                return  # Segment never produced this file
+            except PermissionError as e:  # Specifically catch PermissionError for retries
+                if i < attempts - 1:
+                    logger.warning(
+                        "File locked, retrying in 0.5s: %s. Error: %s", f_path, e)
+                    time.sleep(0.5)
+                else:
                     logger.error(
-                        "Unknown error while cleaning temporary file %s: %s", f_path, str(e))
-                    break  # Don't retry on other errors
+                        "Failed to delete file after multiple attempts: %s. Error: %s", f_path, e)
+            except Exception as e:
+                logger.error(
+                    "Unknown error while cleaning temporary file %s: %s", f_path, str(e))
+                return  # Don't retry on other errors
@@ -1,7 +1,12 @@
 import json
+import logging
 import os
+import orjson
 from typing import Dict, List, Optional, Any
 from .base_service import SingletonService
+from server.utils.file_io import read_bytes
+
+logger = logging.getLogger(__name__)
 
 
 class WorkflowService(SingletonService):
@@ -11,6 +16,10 @@ class WorkflowService(SingletonService):
         self.server_root = os.path.dirname(
             os.path.dirname(os.path.abspath(__file__)))
         self.workflow_dir = os.path.join(self.server_root, "workflow")
+        # Parsed workflow files keyed on path: (mtime_ns, size, data)
+        self._parsed_cache: Dict[str, tuple] = {}
+        # get_workflow results keyed on path: (mtime_ns, size, result)
+        self._detail_cache: Dict[str, tuple] = {}
 
     def load_workflow(self, workflow_name: Optional[str]) -> Optional[Dict[str, Any]]:
         """Load workflow configuration."""
@@ -19,20 +28,20 @@ class WorkflowService(SingletonService):
 
         workflow_path = os.path.join(self.workflow_dir, workflow_name)
 
-        print(f"Loading workflow from: {workflow_path}")
+        logger.debug("Loading workflow from: %s", workflow_path)
 
         try:
             if not os.path.exists(workflow_path):
                 if os.path.exists(workflow_name):
                     workflow_path = workflow_name
                 else:
-                    print(f"Workflow file not found at: {workflow_path}")
+                    logger.debug("Workflow file not found at: %s", workflow_path)
                     if not workflow_name.endswith('.json'):
                         workflow_path = os.path.join(
                             self.workflow_dir, workflow_name + '.json')
                         if not os.path.exists(workflow_path):
-                            print(
-                                f"Workflow file not found at: {workflow_path}")
+                            logger.warning(
+                                "Workflow file not found at: %s", workflow_path)
                             return None
                     else:
                         return None
@@ -40,11 +49,11 @@ class WorkflowService(SingletonService):
             with open(workflow_path, 'r', encoding='utf-8') as f:
                 workflow_data = json.load(f)
                 if not isinstance(workflow_data, dict):
-                    print(f"Invalid workflow format in {workflow_name}")
+                    logger.warning("Invalid workflow format in %s", workflow_name)
                     return None
                 return workflow_data
         except Exception as e:
-            print(f"Error loading workflow: {str(e)}")
+            logger.error("Error loading workflow: %s", e)
             return None
 
     def update_workflow_prompt(self, workflow: Dict[str, Any], prompt: str, negative_prompt: str = '') -> Dict[str, Any]:
@@ -94,7 +103,7 @@ class WorkflowService(SingletonService):
         """Update reference images in the workflow and remove invalid dependencies."""
         delete_nodes = []
         table = {"one": 0, "two": 1, "three": 2}
-        print("Ref image paths: ", reference_image_paths)
+        logger.debug("Ref image paths: %s", reference_image_paths)
         # Sort reference_image_paths based on length, empty strings will be at the end
         reference_image_paths = sorted(
             reference_image_paths, key=lambda x: (x == '', len(x) if x else 0))
@@ -114,8 +123,8 @@ class WorkflowService(SingletonService):
                             delete_nodes.append(k)
 
         if delete_nodes:
-            print(
-                f"Nodes to delete due to missing reference images: {delete_nodes}")
+            logger.debug(
+                "Nodes to delete due to missing reference images: %s", delete_nodes)
             return self.delete_workflow_nodes(workflow, delete_nodes)
         return workflow
 
@@ -166,8 +175,9 @@ class WorkflowService(SingletonService):
                             if ref_node and input_name in ref_node.get('inputs', {}):
                                 new_source_input = ref_node['inputs'][input_name]
                                 if isinstance(new_source_input, list) and new_source_input and str(new_source_input[0]) != node_id:
-                                    print(
-                                        f"Re-wiring node {node_id}: input '{input_name}' from {ref_node_id} to {new_source_input[0]}")
+                                    logger.debug(
+                                        "Re-wiring node %s: input '%s' from %s to %s",
+                                        node_id, input_name, ref_node_id, new_source_input[0])
                                     inputs[input_name] = new_source_input
                                     can_rewire = True
                                     graph_changed = True
@@ -192,30 +202,41 @@ class WorkflowService(SingletonService):
 
         return workflow
 
+    def _parse_cached(self, workflow_path: str, st: os.stat_result) -> Any:
+        """Parse a workflow file, reusing the last result while its mtime and size are unchanged."""
+        cached = self._parsed_cache.get(workflow_path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        data = orjson.loads(read_bytes(workflow_path))
+        self._parsed_cache[workflow_path] = (st.st_mtime_ns, st.st_size, data)
+        return data
+
     def list_workflows(self) -> List[Dict[str, Any]]:
         """List all available workflows."""
         workflows = []
         try:
-            for filename in os.listdir(self.workflow_dir):
-                if filename.endswith('.json'):
-                    workflow_path = os.path.join(self.workflow_dir, filename)
+            with os.scandir(self.workflow_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith('.json'):
+                        continue
                     try:
-                        with open(workflow_path, 'r', encoding='utf-8') as f:
-                            workflow_data = json.load(f)
-                            info = {
-                                'name': filename,
-                                'path': workflow_path,
-                                'size': os.path.getsize(workflow_path),
-                                'modified': os.path.getmtime(workflow_path)
-                            }
-                            # Extract more details if possible
-                            workflows.append(info)
+                        st = entry.stat()
+                        # Only list files that parse; unchanged files are not re-read
+                        self._parse_cached(entry.path, st)
+                        info = {
+                            'name': entry.name,
+                            'path': entry.path,
+                            'size': st.st_size,
+                            'modified': st.st_mtime
+                        }
+                        # Extract more details if possible
+                        workflows.append(info)
                     except Exception as e:
-                        print(
-                            f"Error loading workflow info {filename}: {str(e)}")
+                        logger.warning(
+                            "Error loading workflow info %s: %s", entry.name, e)
             return sorted(workflows, key=lambda x: x['name'])
         except Exception as e:
-            print(f"Error listing workflows: {str(e)}")
+            logger.error("Error listing workflows: %s", e)
             return []
 
     def get_workflow(self, name: str) -> Optional[Dict[str, Any]]:
@@ -224,18 +245,24 @@ class WorkflowService(SingletonService):
             name += '.json'
 
         workflow_path = os.path.join(self.workflow_dir, name)
-        if not os.path.exists(workflow_path):
+        try:
+            st = os.stat(workflow_path)
+        except OSError:
             return None
 
+        # The result is only serialized by callers, so it is shared between calls
+        cached = self._detail_cache.get(workflow_path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+
         try:
-            with open(workflow_path, 'r', encoding='utf-8') as f:
-                workflow = json.load(f)
+            workflow = self._parse_cached(workflow_path, st)
 
             metadata = {
                 'name': name,
                 'path': workflow_path,
-                'size': os.path.getsize(workflow_path),
-                'modified': os.path.getmtime(workflow_path),
+                'size': st.st_size,
+                'modified': st.st_mtime,
                 'nodes': {
                     node_id: {
                         'type': node.get('class_type'),
@@ -244,7 +271,10 @@ class WorkflowService(SingletonService):
                     } for node_id, node in workflow.items() if isinstance(node, dict)
                 }
             }
-            return {'metadata': metadata, 'workflow': workflow}
+            result = {'metadata': metadata, 'workflow': workflow}
+            self._detail_cache[workflow_path] = (
+                st.st_mtime_ns, st.st_size, result)
+            return result
         except Exception as e:
-            print(f"Error getting workflow {name}: {str(e)}")
+            logger.error("Error getting workflow %s: %s", name, e)
             return None
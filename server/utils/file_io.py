@@ -0,0 +1,70 @@
+import mmap
+import os
+import orjson
+
+# Windows needs O_BINARY to stop the CRT from translating line endings
+_READ_FLAGS = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+
+
+def _read_fd(fd: int, size: int) -> bytes:
+    # Ask for one extra byte: a short read means we already hit EOF
+    data = os.read(fd, size + 1)
+    if len(data) <= size:
+        return data
+    # The file grew since fstat, read the rest
+    chunks = [data]
+    chunk = os.read(fd, 65536)
+    while chunk:
+        chunks.append(chunk)
+        chunk = os.read(fd, 65536)
+    return b''.join(chunks)
+
+
+def read_bytes(path: str) -> bytes:
+    """Read a whole (small) file using only open/fstat/read/close syscalls"""
+    fd = os.open(path, _READ_FLAGS)
+    try:
+        return _read_fd(fd, os.fstat(fd).st_size)
+    finally:
+        os.close(fd)
+
+
+def read_text(path: str, encoding: str = 'utf-8') -> str:
+    """Read a whole (small) text file, normalizing newlines like open(path, 'r')"""
+    text = read_bytes(path).decode(encoding)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+# Same layout as json.dump(obj, f, ensure_ascii=False, indent=2)
+JSON_WRITE_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+
+# Above this size read_json parses straight from a read-only mapping of the file
+MMAP_MIN_SIZE = 4 * 1024 * 1024
+
+
+def read_json(path: str):
+    """Parse a JSON file with orjson; large files are mapped instead of copied into a bytes buffer"""
+    fd = os.open(path, _READ_FLAGS)
+    try:
+        size = os.fstat(fd).st_size
+        if size >= MMAP_MIN_SIZE:
+            # The view has to be released before the mapping closes
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                return orjson.loads(view)
+        return orjson.loads(_read_fd(fd, size))
+    finally:
+        os.close(fd)
+
+
+def write_bytes(path: str, data: bytes) -> None:
+    """Write pre-encoded bytes to path in a single write"""
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def write_json(path: str, obj) -> None:
+    """Write obj as indented UTF-8 JSON in a single write"""
+    write_bytes(path, orjson.dumps(obj, option=JSON_WRITE_OPTIONS))
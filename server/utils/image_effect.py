@@ -1,42 +1,25 @@
 from __future__ import annotations
 import numpy as np
-from PIL import Image, ImageEnhance, ImageChops
-import random
-import math
-from typing import Dict, Tuple
+from PIL import Image
+from typing import Dict, Iterator, Tuple
+
+# Bộ lọc thu phóng theo params['resize_quality']; khung pan chỉ là lát cắt của ảnh đã thu phóng,
+# nên BICUBIC gần như không khác LANCZOS bằng mắt nhưng nhanh hơn nhiều
+RESIZE_FILTERS = {
+    'fast': Image.BILINEAR,
+    'balanced': Image.BICUBIC,
+    'high': Image.LANCZOS,
+}
+DEFAULT_RESIZE_QUALITY = 'balanced'
 
 
 class ImageEffects:
     @staticmethod
-    def fade_effect(image: Image.Image, time_val: float, duration: float, params: Dict) -> Image.Image:
-        """Hiệu ứng mờ dần vào/ra
-        Sử dụng điều chỉnh độ sáng thay vì độ trong suốt để đảm bảo tương thích với MoviePy
-        """
-        if params.get('fade_duration', 0) <= 0:
-            return image
-
-        fade_duration = params['fade_duration']
-        brightness = 1.0
-
-        # Giai đoạn mờ dần vào
-        if time_val < fade_duration:
-            brightness = time_val / fade_duration
-        # Giai đoạn mờ dần ra
-        elif duration - time_val < fade_duration:
-            brightness = (duration - time_val) / fade_duration
-
-        # Sử dụng điều chỉnh độ sáng để thực hiện mờ dần vào/ra, thay vì độ trong suốt
-        if brightness < 1.0:
-            enhancer = ImageEnhance.Brightness(image)
-            image = enhancer.enhance(brightness)
-
-        return image
+    def _pan_layout(img_w: int, img_h: int, params: Dict) -> Tuple[int, int, bool, bool]:
+        """Kích thước ảnh sau khi thu phóng, hướng di chuyển và việc có di chuyển hay không
 
-    @staticmethod
-    def pan_effect(image: Image.Image, time_val: float, duration: float, params: Dict) -> Image.Image:
-        """
-        Hiệu ứng di chuyển và thu phóng mượt mà, ngăn ngừa kéo giãn hình ảnh.
-        Tính toán tỷ lệ thu phóng chính xác để đảm bảo hình ảnh giữ tỷ lệ khung hình gốc trong phạm vi di chuyển.
+        Returns:
+            (new_width, new_height, use_horizontal, moving)
         """
         output_w, output_h = params['output_size']
         pan_range = params.get('pan_range', (0.3, 0))
@@ -50,87 +33,125 @@ class ImageEffects:
         elif v_range > 0:
             use_horizontal = False
 
-        # Nếu không có di chuyển, cắt hình ảnh vào giữa
+        # Nếu không có di chuyển, thu phóng vừa khung rồi cắt vào giữa
         if h_range <= 0 and v_range <= 0:
-            img_aspect = image.width / image.height
+            img_aspect = img_w / img_h
             out_aspect = output_w / output_h
-
             if img_aspect > out_aspect:
-                new_height = output_h
-                new_width = int(new_height * img_aspect)
-                scaled_img = image.resize(
-                    (new_width, new_height), Image.LANCZOS)
-                left = (new_width - output_w) // 2
-                return scaled_img.crop((left, 0, left + output_w, output_h))
-            else:
-                new_width = output_w
-                new_height = int(new_width / img_aspect)
-                scaled_img = image.resize(
-                    (new_width, new_height), Image.LANCZOS)
-                top = (new_height - output_h) // 2
-                return scaled_img.crop((0, top, output_w, top + output_h))
+                return int(output_h * img_aspect), output_h, use_horizontal, False
+            return output_w, int(output_w / img_aspect), use_horizontal, False
 
         # Tính toán tỷ lệ thu phóng, giữ tỷ lệ khung hình
-        img_w, img_h = image.width, image.height
-
         if use_horizontal:
             # Tính tỷ lệ thu phóng cho di chuyển ngang
             required_width = output_w * (1 + h_range)
-            ratio_w = required_width / img_w
-            ratio_h = output_h / img_h
-            scale_ratio = max(ratio_w, ratio_h)
+            scale_ratio = max(required_width / img_w, output_h / img_h)
         else:  # Di chuyển dọc
             required_height = output_h * (1 + v_range)
-            ratio_h = required_height / img_h
-            ratio_w = output_w / img_w
-            scale_ratio = max(ratio_w, ratio_h)
-
-        new_width = int(img_w * scale_ratio)
-        new_height = int(img_h * scale_ratio)
+            scale_ratio = max(output_w / img_w, required_height / img_h)
 
-        scaled_img = image.resize((new_width, new_height), Image.LANCZOS)
+        return int(img_w * scale_ratio), int(img_h * scale_ratio), use_horizontal, True
 
-        # Sử dụng hàm chuyển động mượt để tính tiến độ di chuyển
-        progress = ImageEffects._ease_in_out_progress(time_val / duration)
+    @staticmethod
+    def _resize_filter(params: Dict) -> int:
+        """Bộ lọc PIL cho params['resize_quality'] ('fast' | 'balanced' | 'high')"""
+        quality = params.get('resize_quality', DEFAULT_RESIZE_QUALITY)
+        if quality not in RESIZE_FILTERS:
+            raise ValueError(f"Unknown resize_quality: {quality}")
+        return RESIZE_FILTERS[quality]
 
-        # Tính vị trí khung cắt
-        if use_horizontal:
-            max_x_offset = scaled_img.width - output_w
-            x_offset = int(max_x_offset * progress)
-            y_offset = (scaled_img.height - output_h) // 2
-        else:  # Di chuyển dọc
-            max_y_offset = scaled_img.height - output_h
-            y_offset = int(max_y_offset * progress)
-            x_offset = (scaled_img.width - output_w) // 2
+    @classmethod
+    def prepare(cls, image: Image.Image, duration: float, params: Dict) -> PreparedImage:
+        """Chuẩn bị một lần cho cả đoạn video: thu phóng ảnh nguồn một lần duy nhất
 
-        return scaled_img.crop((
-            x_offset, y_offset,
-            x_offset + output_w, y_offset + output_h
-        ))
+        Mọi khung hình sau đó chỉ là một lát cắt của mảng này (iter_frames),
+        thay vì thu phóng lại ảnh cho từng khung hình.
+        """
+        if not params.get('use_pan', True):
+            # Không di chuyển: khung hình giữ nguyên kích thước ảnh gốc
+            return PreparedImage(np.asarray(image), image.width, image.height,
+                                 True, False, duration, params.get('fade_duration', 0))
 
-    @staticmethod
-    def _ease_in_out_progress(progress: float) -> float:
-        """Hàm chuyển động mượt mà, tạo cảm giác tự nhiên hơn"""
-        # Sử dụng hàm sin cho chuyển động mượt
-        return 0.5 * (1 - math.cos(math.pi * progress))
+        output_w, output_h = params['output_size']
+        new_width, new_height, use_horizontal, moving = cls._pan_layout(
+            image.width, image.height, params)
+        # Sai số làm tròn int() có thể làm ảnh nhỏ hơn khung 1px; không bao giờ để nhỏ hơn khung
+        new_width, new_height = max(new_width, output_w), max(new_height, output_h)
+        scaled = np.ascontiguousarray(
+            image.resize((new_width, new_height), cls._resize_filter(params)))
+        return PreparedImage(scaled, output_w, output_h, use_horizontal, moving,
+                             duration, params.get('fade_duration', 0))
 
     @classmethod
-    def apply_effects(cls, image: Image.Image, time_val: float, duration: float, params: Dict) -> Image.Image:
-        """Áp dụng tất cả các hiệu ứng"""
-        # Thứ tự thực hiện hiệu ứng
-        effect_chain = []
+    def iter_frames(cls, prep: PreparedImage, total_frames: int, fps: float) -> Iterator[np.ndarray]:
+        """Lần lượt từng khung hình i / fps của cả đoạn
+
+        Tiến độ chuyển động và góc cắt của mọi khung hình được tính một lần bằng numpy.
+        Khung hình không mờ là một view (không sao chép) vào prep.scaled;
+        khung hình mờ dần vào/ra là một mảng mới.
+        """
+        times = np.arange(total_frames) / fps
+        xs, ys = cls._crop_offset_table(prep, times)
+        for time_val, x, y in zip(times.tolist(), xs.tolist(), ys.tolist()):
+            yield cls._crop_frame(prep, time_val, x, y)
+
+    @staticmethod
+    def _crop_offset_table(prep: PreparedImage, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Góc cắt (x, y) của mọi thời điểm trong times
 
-        # Áp dụng hiệu ứng di chuyển trước để tránh bị hiệu ứng mờ dần vào/ra làm mất
-        if params.get('use_pan', True):
-            effect_chain.append(cls.pan_effect)
+        Tiến độ di chuyển dùng hàm chuyển động mượt 0.5 * (1 - cos(pi * t / duration));
+        không di chuyển thì cắt vào giữa.
+        """
+        scaled_h, scaled_w = prep.scaled.shape[:2]
+        x_range = scaled_w - prep.output_w
+        y_range = scaled_h - prep.output_h
+        xs = np.full(len(times), x_range // 2, dtype=np.intp)
+        ys = np.full(len(times), y_range // 2, dtype=np.intp)
+        if prep.moving:
+            progress = 0.5 * (1 - np.cos(np.pi * (times / prep.duration)))
+            if prep.use_horizontal:
+                xs = (x_range * progress).astype(np.intp)
+            else:
+                ys = (y_range * progress).astype(np.intp)
+        return xs, ys
 
-        # Hiệu ứng mờ dần vào/ra nên là bước cuối cùng
-        effect_chain.append(cls.fade_effect)
+    @classmethod
+    def _crop_frame(cls, prep: PreparedImage, time_val: float, x: int, y: int) -> np.ndarray:
+        """Cắt khung hình tại góc (x, y) rồi áp dụng mờ dần vào/ra nếu cần"""
+        view = prep.scaled[y:y + prep.output_h, x:x + prep.output_w]
 
-        processed_image = image.copy()
-        for effect in effect_chain:
-            processed_image = effect(
-                processed_image, time_val, duration, params)
-            # Không cần cắt lại sau mỗi hiệu ứng vì hàm hiệu ứng đã xử lý kích thước
+        brightness = cls._fade_brightness(time_val, prep.duration, prep.fade_duration)
+        if brightness >= 1.0:
+            return view
+        frame = np.empty_like(view)
+        np.multiply(view, brightness, out=frame, casting='unsafe')
+        return frame
 
-        return processed_image
+    @staticmethod
+    def _fade_brightness(time_val: float, duration: float, fade_duration: float) -> float:
+        """Độ sáng của hiệu ứng mờ dần vào/ra tại time_val (1.0 là không mờ)"""
+        if fade_duration <= 0:
+            return 1.0
+        # Giai đoạn mờ dần vào
+        if time_val < fade_duration:
+            return time_val / fade_duration
+        # Giai đoạn mờ dần ra
+        if duration - time_val < fade_duration:
+            return (duration - time_val) / fade_duration
+        return 1.0
+
+
+class PreparedImage:
+    """Ảnh đã thu phóng của một đoạn video cùng các thông số cần để cắt từng khung hình"""
+    __slots__ = ('scaled', 'output_w', 'output_h', 'use_horizontal', 'moving',
+                 'duration', 'fade_duration')
+
+    def __init__(self, scaled: np.ndarray, output_w: int, output_h: int, use_horizontal: bool,
+                 moving: bool, duration: float, fade_duration: float):
+        self.scaled = scaled
+        self.output_w = output_w
+        self.output_h = output_h
+        self.use_horizontal = use_horizontal
+        self.moving = moving
+        self.duration = duration
+        self.fade_duration = fade_duration
@@ -1,5 +1,18 @@
 from datetime import datetime
-from fastapi.responses import JSONResponse
+import orjson
+from typing import Any
+from fastapi.responses import Response
+
+# Giá trị numpy và dict có key không phải str được orjson tuần tự hóa trực tiếp
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class FastResponse(Response):
+    """Phản hồi JSON tuần tự hóa bằng orjson với các tùy chọn được khai báo tường minh"""
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
 
 
 class APIException(Exception):
@@ -18,7 +31,7 @@ def make_response(data=None, msg='', status='success'):
         status: Trạng thái, mặc định là 'success'
 
     Returns:
-        JSONResponse:
+        FastResponse:
         {
             'status': 'success' | 'error',
             'data': Any,
@@ -26,8 +39,32 @@ def make_response(data=None, msg='', status='success'):
         }
     """
     status_code = 200 if status == 'success' else 400
-    return JSONResponse(status_code=status_code, content={
+    return FastResponse(status_code=status_code, content={
         'status': status,
         'data': data,
         'message': msg,
     })
+
+
+class PrebuiltResponse:
+    """Phản hồi cố định, body được tuần tự hóa một lần khi khởi tạo
+
+    Mỗi lần gọi trả về một Response mới (middleware có thể sửa headers),
+    nhưng chỉ bọc lại các bytes đã có sẵn.
+    """
+
+    def __init__(self, data=None, msg='', status='success'):
+        self.status_code = 200 if status == 'success' else 400
+        self.body = orjson.dumps({
+            'status': status,
+            'data': data,
+            'message': msg,
+        }, option=ORJSON_OPTIONS)
+
+    def __call__(self) -> Response:
+        return Response(content=self.body, status_code=self.status_code,
+                        media_type='application/json')
+
+
+# Lỗi thường gặp: dự án không tồn tại
+PROJECT_MISSING = PrebuiltResponse(status='error', msg='Project does not exist')